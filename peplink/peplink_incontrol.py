@@ -0,0 +1,291 @@
+####################
+# PEPLINK INCONTROL2 COLLECTOR CORE
+# Shared by peplinkquery.py (InfluxDB) and v2-aws/peplink_ingest.py (Timestream).
+# OAuth2 client-credentials tokens are cached (and persisted through load/save
+# callables) until shortly before they expire; every API call goes through the
+# Renogy request governor over one pooled keep-alive session. WAN usage and
+# latency are fetched incrementally from per-device cursors, so each poll only
+# asks for intervals newer than the last one stored. Output is the same flat
+# record shape the Renogy collectors use: {measure, value, sub, category,
+# device_id, name, sku, uname, time (ms)}.
+#####################
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from renogy_governor import build_session, governor_from_env
+
+TOKEN_PATH = "/api/oauth2/token"
+# InControl2 REST paths (organisation / group scoped)
+ENDPOINTS = {
+    "devices": "/rest/o/{org}/g/{group}/d",
+    "device": "/rest/o/{org}/g/{group}/d/{device}",
+    "usage": "/rest/o/{org}/g/{group}/d/{device}/bandwidth_per_wan",
+    "latency": "/rest/o/{org}/g/{group}/d/{device}/wan_latency",
+}
+TOKEN_REFRESH_MARGIN = 120  # refresh this many seconds before the token expires
+
+# Cellular/WAN signal fields copied from each interface, as {raw field: measure}
+SIGNAL_FIELDS = {"rssi": "rssi", "sinr": "sinr", "rsrp": "rsrp", "rsrq": "rsrq", "signal_bar": "bars"}
+
+
+def parse_time(value):
+    """Epoch seconds (from epoch s/ms or an ISO-8601 string, UTC unless zoned), or None."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_time(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _first(row, *keys):
+    for key in keys:
+        if row.get(key) is not None:
+            return row[key]
+    return None
+
+
+class InControlClient:
+    """InControl2 API client with OAuth token caching, a pooled session and the request governor."""
+
+    def __init__(self, client_id, client_secret, org_id, group_id, host="https://api.ic.peplink.com",
+                 pool_size=8, timeout=15.0, governor=None, load_token=None, save_token=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.org_id = org_id
+        self.group_id = group_id
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.governor = governor or governor_from_env(rate=float(os.getenv("PEPLINK_RATE_LIMIT", 5)),
+                                                      burst=float(os.getenv("PEPLINK_RATE_BURST", 10)))
+        self.session = build_session(pool_size)
+        self.save_token = save_token
+        self.token_requests = 0
+        self._token = (load_token() if load_token else None) or {}
+        self._token_lock = threading.Lock()
+
+    def access_token(self, force=False):
+        """The cached bearer token, fetched again when missing, near expiry or forced (after a 401)."""
+        with self._token_lock:
+            if force or not self._token.get("access_token") or \
+                    self._token.get("expires_at", 0) - TOKEN_REFRESH_MARGIN <= time.time():
+                self._token = self._fetch_token()
+                if self.save_token:
+                    try:
+                        self.save_token(self._token)
+                    except Exception as e:
+                        print(f"Error persisting InControl token: {e}")
+            return self._token["access_token"]
+
+    def _fetch_token(self):
+        form = {"client_id": self.client_id, "client_secret": self.client_secret, "grant_type": "client_credentials"}
+        refresh_token = self._token.get("refresh_token")
+        if refresh_token:
+            form.update(grant_type="refresh_token", refresh_token=refresh_token)
+        response = self.governor.call(self.client_id, lambda: self.session.post(
+            f"{self.host}{TOKEN_PATH}", data=form, timeout=self.timeout))
+        if refresh_token and response is not None and response.status_code in (400, 401):
+            # Refresh token expired or revoked; start over with client credentials
+            self._token = {}
+            return self._fetch_token()
+        if response is None or response.status_code != 200:
+            detail = "no response" if response is None else f"{response.status_code} - {response.text}"
+            raise RuntimeError(f"InControl token request failed: {detail}")
+        self.token_requests += 1
+        token = response.json()
+        return {
+            "access_token": token["access_token"],
+            "refresh_token": token.get("refresh_token"),
+            "expires_at": time.time() + float(token.get("expires_in", 3600)),
+        }
+
+    def get(self, endpoint, params=None, **path):
+        """GET an ENDPOINTS path; returns the response "data", or None on failure (one retry after a 401)."""
+        url = self.host + ENDPOINTS[endpoint].format(org=self.org_id, group=self.group_id, **path)
+        for attempt in range(2):
+            token = self.access_token(force=attempt > 0)
+            response = self.governor.call(self.client_id, lambda: self.session.get(
+                url, params=params, headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout))
+            if response is None:
+                print(f"Error fetching {endpoint}: no response (retries exhausted or circuit open)")
+                return None
+            if response.status_code != 401:
+                break
+        if response.status_code != 200:
+            print(f"Error fetching {endpoint}: {response.status_code} - {response.text}")
+            return None
+        payload = response.json()
+        if isinstance(payload, dict):
+            if payload.get("resp_code", "SUCCESS") != "SUCCESS":
+                print(f"Error fetching {endpoint}: {payload.get('resp_code')} - {payload.get('message')}")
+                return None
+            return payload.get("data", payload.get("response"))
+        return payload
+
+    def list_devices(self):
+        return self.get("devices") or []
+
+
+class CursorStore:
+    """Last interval time fetched per (stream, device), persisted through load/save callables."""
+
+    def __init__(self, load_state=None, save_state=None, lookback=6 * 3600.0):
+        self.save_state = save_state
+        self.lookback = lookback  # never ask for more than this many seconds (first poll, long outages)
+        self.cursors = (load_state() if load_state else None) or {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def start(self, stream, device_id, now):
+        with self._lock:
+            return max(self.cursors.get(f"{stream}:{device_id}", float("-inf")), now - self.lookback)
+
+    def advance(self, stream, device_id, ts):
+        key = f"{stream}:{device_id}"
+        with self._lock:
+            if ts > self.cursors.get(key, float("-inf")):
+                self.cursors[key] = ts
+                self._dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.cursors)
+
+    def restore(self, cursors):
+        """Roll back to a snapshot so the next poll fetches the same intervals again (e.g. after a failed write)."""
+        with self._lock:
+            self.cursors = dict(cursors)
+
+    def save(self):
+        with self._lock:
+            if not (self.save_state and self._dirty):
+                return
+            try:
+                self.save_state(dict(self.cursors))
+                self._dirty = False
+            except Exception as e:
+                print(f"Error persisting InControl cursors: {e}")
+
+
+def device_identity(device):
+    """The record fields that identify one router (uname pep-<last 3 of serial>)."""
+    serial = str(device.get("sn") or device.get("id"))
+    return {
+        "category": "Router",
+        "device_id": str(device.get("id")),
+        "name": device.get("name") or serial,
+        "sku": device.get("product_name") or device.get("product_code") or "PEPLINK",
+        "uname": f"pep-{serial.replace('-', '')[-3:].lower()}",
+    }
+
+
+def _wan_sub(row):
+    wan_id = _first(row, "wan_id", "id", "interface_id")
+    return f"wan{wan_id}" if wan_id is not None else "wan"
+
+
+def signal_records(detail, identity, now_ms):
+    """Status and signal of each WAN interface in a device detail payload (a snapshot at now)."""
+    records = []
+    for interface in (detail or {}).get("interfaces") or []:
+        sub = _wan_sub(interface)
+        status = str(interface.get("status", "")).lower()
+        records.append({"measure": "up", "value": 1.0 if status in ("connected", "up", "online") else 0.0,
+                        "sub": sub, "time": now_ms, **identity})
+        signal = dict(interface)
+        for nested in ("cellular", "signal"):
+            if isinstance(signal.get(nested), dict):
+                signal.update(signal.pop(nested))
+        for field, measure in SIGNAL_FIELDS.items():
+            value = signal.get(field)
+            if isinstance(value, (int, float)):
+                records.append({"measure": measure, "value": float(value), "sub": sub, "time": now_ms, **identity})
+    return records
+
+
+def interval_records(rows, identity, measures, cursor):
+    """
+    Records for usage/latency rows newer than cursor; measures maps measure -> raw
+    field names. Returns (records, newest row time).
+    """
+    records = []
+    newest = cursor
+    for row in rows or []:
+        ts = parse_time(_first(row, "datetime", "time", "timestamp", "start"))
+        if ts is None or ts <= cursor:
+            continue
+        newest = max(newest, ts)
+        sub = _wan_sub(row)
+        for measure, fields in measures.items():
+            value = _first(row, *fields)
+            if isinstance(value, (int, float)):
+                records.append({"measure": measure, "value": float(value), "sub": sub,
+                                "time": int(ts * 1000), **identity})
+    return records, newest
+
+
+USAGE_MEASURES = {"rx_mb": ("download", "rx", "rx_mb"), "tx_mb": ("upload", "tx", "tx_mb")}
+LATENCY_MEASURES = {"latency_ms": ("latency", "avg", "avg_latency"), "loss_pct": ("loss", "packet_loss")}
+
+
+def collect_device(client, cursors, device, now=None):
+    """Signal snapshot plus usage and latency intervals newer than the device's cursors."""
+    now = now or time.time()
+    identity = device_identity(device)
+    device_id = identity["device_id"]
+    records = signal_records(client.get("device", device=device_id), identity, int(now * 1000))
+
+    for stream, measures in (("usage", USAGE_MEASURES), ("latency", LATENCY_MEASURES)):
+        start = cursors.start(stream, device_id, now)
+        rows = client.get(stream, params={"start": format_time(start), "end": format_time(now)}, device=device_id)
+        if rows is None:
+            continue  # keep the cursor so the next poll asks for the same window again
+        new_records, newest = interval_records(rows, identity, measures, start)
+        records.extend(new_records)
+        cursors.advance(stream, device_id, newest)
+    return records
+
+
+def collect_all(client, cursors, devices=None, max_workers=8):
+    """Poll every device concurrently (one bad device doesn't sink the cycle); returns flat records."""
+    devices = client.list_devices() if devices is None else devices
+    now = time.time()
+
+    def collect(device):
+        try:
+            return collect_device(client, cursors, device, now)
+        except Exception as e:
+            print(f"Error collecting InControl device {device.get('id')}: {e}")
+            return []
+
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(devices)))) as executor:
+        return [record for records in executor.map(collect, devices) for record in records]
+
+
+def client_from_env(client_id=None, client_secret=None, load_token=None, save_token=None):
+    """InControlClient from PEPLINK_* settings (credentials may come from a secret instead)."""
+    return InControlClient(
+        client_id or os.getenv("PEPLINK_CLIENT_ID"),
+        client_secret or os.getenv("PEPLINK_CLIENT_SECRET"),
+        org_id=os.getenv("PEPLINK_ORG_ID"),
+        group_id=os.getenv("PEPLINK_GROUP_ID"),
+        host=os.getenv("PEPLINK_HOST", "https://api.ic.peplink.com"),
+        pool_size=int(os.getenv("PEPLINK_MAX_WORKERS", 8)),
+        timeout=float(os.getenv("PEPLINK_REQUEST_TIMEOUT", 15)),
+        load_token=load_token,
+        save_token=save_token,
+    )
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import atexit
+
+# Shared renogy_*.py modules (InfluxDB writer, request governor, JSON state files)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, "..", "renogy"))
+
+from influxdb_client import InfluxDBClient, Point, WritePrecision
+from dotenv import load_dotenv
+from renogy_influx import InfluxWriter
+from renogy_schedule import GridSchedule
+from renogy_state import file_state_io
+from peplink_incontrol import CursorStore, client_from_env, collect_all
+
+# Load environment variables
+env_path = "/usr/local/etc/peplink/peplink.env"
+load_dotenv(env_path)
+
+# TIMING
+collect_interval = int(os.getenv("PEPLINK_INTERVAL", 300))  # Default to 5 minutes
+schedule_jitter = float(os.getenv("SCHEDULE_JITTER", 0))  # Max random delay (seconds) added to each wake-up
+
+# InControl2 client; the OAuth token and usage/latency cursors survive restarts
+state_dir = os.getenv("PEPLINK_STATE_DIR", "/var/lib/peplink")
+max_workers = int(os.getenv("PEPLINK_MAX_WORKERS", 8))
+load_token, save_token = file_state_io(os.path.join(state_dir, "token.json"))
+incontrol = client_from_env(load_token=load_token, save_token=save_token)
+cursors = CursorStore(*file_state_io(os.path.join(state_dir, "cursors.json")),
+                      lookback=float(os.getenv("PEPLINK_LOOKBACK", 6 * 3600)))
+atexit.register(cursors.save)
+
+# InfluxDB setup (same background writer and spool as renogyquery.py)
+influx_url = os.getenv("INFLUX_URL")
+influx_token = os.getenv("INFLUX_TOKEN")
+influx_org = os.getenv("INFLUX_ORG")
+influx_bucket = os.getenv("INFLUX_BUCKET")
+
+client = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org, enable_gzip=True)
+influx_writer = InfluxWriter(
+    client, influx_bucket, org=influx_org,
+    batch_size=int(os.getenv("INFLUX_BATCH_SIZE", 500)),
+    flush_interval=float(os.getenv("INFLUX_FLUSH_INTERVAL", 10)),
+    spool_path=os.getenv("INFLUX_SPOOL_PATH", os.path.join(state_dir, "influx_spool.lp")),
+    spool_max_bytes=int(float(os.getenv("INFLUX_SPOOL_MAX_MB", 50)) * 1024 * 1024),
+)
+atexit.register(influx_writer.close)
+
+# Write records to InfluxDB
+def write_records_to_influx(records):
+    """Queue records as NetworkMonitoring points: one per device/WAN/time, tagged device, uname and wan."""
+    points = {}
+    for record in records:
+        key = (record["uname"], record["sub"], record["time"])
+        if key not in points:
+            points[key] = (Point("NetworkMonitoring").tag("device", record["name"]).tag("uname", record["uname"])
+                           .tag("wan", record["sub"]).time(record["time"] // 1000, WritePrecision.S))
+        points[key].field(record["measure"], record["value"])
+    influx_writer.write(points.values())
+    return len(points)
+
+# Poll all routers
+def monitor_devices():
+    """Poll every InControl device concurrently and queue what's new since the last poll."""
+    started = time.perf_counter()
+    records = collect_all(incontrol, cursors, max_workers=max_workers)
+    written = write_records_to_influx(records) if records else 0
+    cursors.save()
+    print(f"Queued {written} points ({len(records)} values) in {time.perf_counter() - started:.2f}s")
+
+# Scheduler
+def run_scheduler(max_ticks=None):
+    """Poll on the shared drift-free grid (renogy_schedule); overrun ticks are skipped, not run back-to-back."""
+    schedule = GridSchedule({"incontrol": collect_interval}, schedule_jitter)
+    ticks = 0
+    while max_ticks is None or ticks < max_ticks:
+        schedule.wait()
+        try:
+            monitor_devices()
+        except Exception as e:
+            print(f"Error polling InControl: {e}")
+        missed = schedule.advance(["incontrol"])["incontrol"]
+        if missed:
+            print(f"Schedule behind; skipped {missed} ticks")
+        ticks += 1
+
+# Main Loop
+if __name__ == "__main__":
+    print("Starting Peplink monitoring...")
+    run_scheduler()
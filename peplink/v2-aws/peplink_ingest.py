@@ -0,0 +1,83 @@
+import time
+import sys
+import os
+
+# Add the dependencies folder to the Python path (only if it was packaged)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+dependencies_dir = os.path.join(current_dir, "dependencies")
+if os.path.isdir(dependencies_dir):
+    sys.path.append(dependencies_dir)
+# Shared peplink_*/renogy_*.py modules (copied next to this file when packaging the Lambda)
+if not os.path.exists(os.path.join(current_dir, "peplink_incontrol.py")):
+    sys.path.append(os.path.dirname(current_dir))
+if not os.path.exists(os.path.join(current_dir, "renogy_aws.py")):
+    sys.path.append(os.path.join(current_dir, "..", "..", "renogy"))
+
+import json
+import logging
+# Same Timestream batching/retries, AWS client and cache helpers as the Renogy Lambda
+from renogy_aws import CACHE_TTL_SECRETS, cached, get_aws_client, s3_state_io, write_to_timestream
+from renogy_state import file_state_io
+from peplink_incontrol import CursorStore, client_from_env, collect_all
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.getenv("PEPLINK_MAX_WORKERS", 8))
+# Token and cursors live in S3 when PEPLINK_STATE_BUCKET is set (survive cold starts), else /tmp
+STATE_BUCKET = os.getenv("PEPLINK_STATE_BUCKET")
+STATE_PREFIX = os.getenv("PEPLINK_STATE_PREFIX", "peplink/")
+# Reused across warm invocations
+_incontrol = None
+_cursors = None
+
+def state_io(name):
+    if STATE_BUCKET:
+        return s3_state_io(STATE_BUCKET, f"{STATE_PREFIX}{name}")
+    return file_state_io(os.path.join("/tmp/peplink", name))
+
+def get_peplink_secrets():
+    """Retrieve InControl client credentials (CLIENT_ID, CLIENT_SECRET) from AWS Secrets Manager."""
+    secret_name = os.getenv("PEPLINK_SECRET_NAME", "peplink_incontrol_secrets")
+    response = get_aws_client("secretsmanager").get_secret_value(SecretId=secret_name)
+    secret = json.loads(response["SecretString"])
+    return secret["CLIENT_ID"], secret["CLIENT_SECRET"]
+
+def get_incontrol():
+    """Build the client on first use (loads the persisted token) and reuse it across warm invocations."""
+    global _incontrol
+    client_id, client_secret = cached("peplink_secrets", CACHE_TTL_SECRETS, get_peplink_secrets)
+    if _incontrol is None or _incontrol.client_id != client_id:
+        _incontrol = client_from_env(client_id, client_secret, *state_io("token.json"))
+    return _incontrol
+
+def get_cursors():
+    global _cursors
+    if _cursors is None:
+        _cursors = CursorStore(*state_io("cursors.json"), lookback=float(os.getenv("PEPLINK_LOOKBACK", 6 * 3600)))
+    return _cursors
+
+#################### 
+# LAMBDA HANDLER 
+#####################
+def handler(event, context):
+    """Lambda entry point."""
+    db = os.getenv("TIMESTREAM_DB", "nomad_oracle")
+    table = os.getenv("PEPLINK_TIMESTREAM_TABLE", "peplink_data")
+    started = time.perf_counter()
+
+    # Step 1: Poll every router concurrently (signal snapshot + usage/latency since the cursors)
+    incontrol = get_incontrol()
+    cursors = get_cursors()
+    checkpoint = cursors.snapshot()
+    records = collect_all(incontrol, cursors, max_workers=MAX_WORKERS)
+
+    # Step 2: Write to Timestream, then move the cursors on. If any record wasn't written, fetch the same
+    # intervals again next time; Timestream accepts the identical records that did land a second time
+    written = write_to_timestream([records], db, table) if records else 0
+    if written < len(records):
+        cursors.restore(checkpoint)
+    cursors.save()
+    logger.info(f"Peplink: {written}/{len(records)} records in {time.perf_counter() - started:.2f}s "
+                f"(token requests: {incontrol.token_requests}, governor: {incontrol.governor.stats})")
+    return {"records": len(records), "written": written}
@@ -0,0 +1,126 @@
+"""
+Deadband filter benchmark: write volume saved vs. what a dashboard would show.
+
+Runs a capture (or a synthetic 24 h profile at a 10 s poll: flat overnight
+voltage with shunt-resolution noise, idle inverter, fridge duty cycles, solar
+day) through the Pi transforms and DeadbandFilter, then reports points and
+fields written with and without the filter. Each field is rebuilt from its
+written points both as a step (hold last value) and as a straight line between
+points (Grafana's default) and compared with every original sample; errors are
+reported as a fraction of the field's deadband, so <= 1.0 means nothing moved
+further than the configured threshold without being written.
+
+    python3 renogy/bench/bench_deadband.py
+    python3 renogy/bench/bench_deadband.py --rules 'Volts*:0.02,Amps*:0.1,Watts*:2%' --heartbeat 600
+    python3 renogy/bench/bench_deadband.py /var/lib/renogy/capture/pi-*.jsonl.gz
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, ".."))
+
+from renogy_capture import read_capture
+from renogy_deadband import DeadbandFilter, parse_rules
+
+DEFAULT_RULES = "Volts*:0.02,Amps*:0.1,Watts*:2%,BatteryTemp:0.5,SoC:0.1,AhRemaining:0.5,Wh*:1"
+
+
+def synthetic_day(interval=10, start=1_700_000_000):
+    """One day of raw samples for Solar/Main/Inverter, as (ts, [(name, raw data)]) cycles."""
+    rng = random.Random(1)
+    volts = 13.25
+    for step in range(int(86400 / interval)):
+        ts = start + step * interval
+        hour = (step * interval / 3600) % 24
+        sun = max(0.0, math.sin((hour - 6) / 12 * math.pi)) if 6 <= hour <= 18 else 0.0
+        fridge = -5.8 if (step * interval) % 3600 < 900 else 0.0
+        solar_amps = round(9.5 * sun * rng.uniform(0.97, 1.0), 2) if sun else 0.0
+        charge_amps = solar_amps * 2.7
+        net = charge_amps - 1.4 + fridge
+        volts = min(14.2, max(12.9, volts + net * 0.00002))
+        battery_volts = round(volts + rng.uniform(-0.003, 0.003), 3)
+        yield ts, [
+            ("Solar", {"solarWatts": round(solar_amps * 36.5, 2), "solarChargingVolts": round(36.5 * (sun > 0), 2),
+                       "solarChargingAmps": solar_amps, "auxiliaryBatteryChargingVolts": battery_volts,
+                       "gridChargeAmps": round(charge_amps * 1000), "auxiliaryBatteryTemperature": round(20 + 6 * sun, 1)}),
+            ("Main", {"batteryVolts": battery_volts, "current": round(net + rng.uniform(-0.02, 0.02), 2)}),
+            ("Inverter", {"batteryVolts": battery_volts, "current": 0.0}),
+        ]
+
+
+def captured_cycles(paths):
+    for ts, group in itertools.groupby(read_capture(paths), key=lambda s: s["ts"]):
+        yield ts, [(s.get("name"), s["data"]) for s in group]
+
+
+def rebuild_error(samples, written, threshold, linear):
+    """Largest |original - rebuilt| over a series, rebuilt from written (ts, value) points."""
+    times = [t for t, _ in written]
+    worst = 0.0
+    for ts, value in samples:
+        i = bisect.bisect_right(times, ts) - 1
+        if i < 0:
+            continue
+        rebuilt = written[i][1]
+        if linear and i + 1 < len(written) and times[i] < ts:
+            (t0, v0), (t1, v1) = written[i], written[i + 1]
+            rebuilt = v0 + (v1 - v0) * (ts - t0) / (t1 - t0)
+        worst = max(worst, abs(value - rebuilt) / threshold if threshold else abs(value - rebuilt))
+    return worst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deadband filter write reduction and reconstruction error")
+    parser.add_argument("paths", nargs="*", help="Pi capture files (*.jsonl.gz); default: synthetic 24 h profile")
+    parser.add_argument("--rules", default=DEFAULT_RULES)
+    parser.add_argument("--heartbeat", type=float, default=300.0)
+    parser.add_argument("--interval", type=float, default=10.0, help="poll interval of the synthetic profile")
+    args = parser.parse_args()
+
+    os.environ.setdefault("INFLUX_URL", "http://127.0.0.1:1")
+    os.environ.update({"INFLUX_SPOOL_PATH": "", "RAW_CAPTURE_DIR": "", "METRICS_PORT": "0", "DEADBAND_RULES": "",
+                       "SOC_STATE_PATH": os.path.join(tempfile.gettempdir(), "bench_deadband_soc.json")})
+    import renogyquery as rq
+
+    rules = parse_rules(args.rules)
+    deadband = DeadbandFilter(rules, heartbeat=args.heartbeat)
+    samples = {}   # (device, field) -> [(ts, value)]
+    written = {}   # (device, field) -> [(ts, value)]
+    points = [0, 0]
+    cycles = captured_cycles(args.paths) if args.paths else synthetic_day(args.interval)
+    for ts, raw in cycles:
+        combined_data = [{"device": name, "data": rq.transform_data(data, rq.DEVICE_PLANS[name])}
+                         for name, data in raw if name in rq.DEVICE_PLANS]
+        points[0] += len(combined_data)
+        for entry in combined_data:
+            for field, value in entry["data"].items():
+                samples.setdefault((entry["device"], field), []).append((ts, value))
+        for entry in rq.apply_deadband(combined_data, ts, deadband):
+            points[1] += 1
+            for field, value in entry["data"].items():
+                written.setdefault((entry["device"], field), []).append((entry["time"], value))
+
+    total = sum(len(v) for v in samples.values())
+    kept = sum(len(v) for v in written.values())
+    print(f"rules: {args.rules}  heartbeat: {args.heartbeat:.0f}s")
+    print(f"points: {points[0]} -> {points[1]} ({points[1] / points[0]:.1%}), "
+          f"fields: {total} -> {kept} ({kept / total:.1%}), stats: {deadband.stats}")
+    print(f"{'device/field':<24} {'samples':>8} {'written':>8} {'kept':>7} {'step err':>9} {'linear err':>11}")
+    for key in sorted(samples):
+        rule = deadband.threshold(*key)
+        series = sorted(written.get(key, []))
+        threshold = 0.0
+        if rule:
+            kind, value = rule
+            threshold = value if kind == "abs" else value / 100 * max(abs(v) for _, v in samples[key])
+        step = rebuild_error(samples[key], series, threshold, linear=False)
+        linear = rebuild_error(samples[key], series, threshold, linear=True)
+        print(f"{'/'.join(key):<24} {len(samples[key]):>8} {len(series):>8} {len(series) / len(samples[key]):>7.1%} "
+              f"{step:>9.2f} {linear:>11.2f}")
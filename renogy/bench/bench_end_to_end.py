@@ -0,0 +1,161 @@
+"""
+End-to-end throughput benchmark for both collectors against the local simulator.
+
+Runs the Lambda handler() (boto3 Timestream/CloudWatch/Secrets Manager calls
+replaced by in-process recorders) and the Raspberry Pi monitor_devices() (InfluxDB
+writer replaced by a recorder) for a number of cycles and reports polls/sec,
+p50/p99 cycle latency and peak RSS.
+
+The collectors' request governor (RENOGY_RATE_LIMIT / RENOGY_RATE_BURST) is set
+explicitly with --client-rate-limit / --client-burst, default high enough not to
+bound the run; once the burst is spent a cycle can't beat devices / rate limit.
+Pass e.g. --client-rate-limit 5 --client-burst 10 to measure the production default.
+
+    python3 renogy/bench/bench_end_to_end.py --devices 50 --latency-ms 80 --cycles 20
+    python3 renogy/bench/bench_end_to_end.py --target lambda --sim-url http://127.0.0.1:8181
+    python3 renogy/bench/bench_end_to_end.py --devices 50 --client-rate-limit 5 --client-burst 10
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, ".."))
+sys.path.append(os.path.join(BENCH_DIR, "..", "v2-aws"))
+
+from renogy_simulator import DEFAULT_ACCESS_KEY, DEFAULT_SECRET_KEY, build_fleet, start_simulator
+
+
+class RecordingTimestream:
+    """Stands in for the timestream-write client; counts records per write_records call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.records = 0
+
+    def write_records(self, **kwargs):
+        self.calls += 1
+        self.records += len(kwargs["Records"])
+
+
+class RecordingCloudWatch:
+    """Stands in for the cloudwatch client."""
+
+    def __init__(self):
+        self.calls = 0
+        self.metrics = 0
+
+    def put_metric_data(self, **kwargs):
+        self.calls += 1
+        self.metrics += len(kwargs["MetricData"])
+
+
+def count_polls(module):
+    """Wrap module.get_device_data to count device polls; returns the counter list."""
+    polls = [0]
+    get_device_data = module.get_device_data
+
+    def counted(*args, **kwargs):
+        polls[0] += 1
+        return get_device_data(*args, **kwargs)
+    module.get_device_data = counted
+    return polls
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(name, latencies, polls):
+    total = sum(latencies)
+    print(f"{name:>7}: {len(latencies)} cycles, {polls} polls, {polls / total:8.1f} polls/s, "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms, p99 {percentile(latencies, 99) * 1000:7.1f} ms, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+def bench_lambda(sim_url, cycles):
+    os.environ["RENOGY_HOST"] = sim_url
+    import renogy_ingest
+
+    renogy_ingest.get_renogy_secrets = lambda: (DEFAULT_SECRET_KEY, DEFAULT_ACCESS_KEY)
+    timestream = renogy_ingest.aws_clients["timestream-write"] = RecordingTimestream()
+    renogy_ingest.aws_clients["cloudwatch"] = RecordingCloudWatch()
+    polls = count_polls(renogy_ingest)
+
+    latencies = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            renogy_ingest.handler({}, None)
+        latencies.append(time.perf_counter() - start)
+    report("lambda", latencies, polls[0])
+    print(f"         timestream: {timestream.calls} calls / {timestream.records} records, "
+          f"cache: {renogy_ingest.cache_stats}")
+
+
+def bench_pi(sim_url, cycles, fleet):
+    os.environ.update({
+        "RENOGY_HOST": sim_url, "ACCESS_KEY": DEFAULT_ACCESS_KEY, "SECRET_KEY": DEFAULT_SECRET_KEY,
+        "DEVICES": ",".join(f"{d['name']}:{d['deviceId']}" for d in fleet),
+        "INFLUX_URL": os.getenv("INFLUX_URL", "http://127.0.0.1:1"), "INFLUX_SPOOL_PATH": "",
+        "SOC_STATE_PATH": os.path.join(tempfile.gettempdir(), "bench_soc_state.json"),
+    })
+    import renogyquery
+
+    points = []
+    renogyquery.influx_writer.write = points.extend
+    polls = count_polls(renogyquery)
+
+    latencies = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            renogyquery.monitor_devices()
+        latencies.append(time.perf_counter() - start)
+    report("pi", latencies, polls[0])
+    print(f"         influx points queued: {len(points)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end collector benchmark against the Renogy simulator")
+    parser.add_argument("--target", choices=("lambda", "pi", "both"), default="both")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=3, help="fleet size (must match the --sim-url simulator if given)")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="simulator-side requests/sec (0 = unlimited)")
+    parser.add_argument("--client-rate-limit", type=float, default=1000.0,
+                        help="collector RENOGY_RATE_LIMIT (requests/sec per access key)")
+    parser.add_argument("--client-burst", type=float, default=None, help="collector RENOGY_RATE_BURST (default: rate limit)")
+    parser.add_argument("--sim-url", help="use an already running simulator instead of an in-process one")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    client_burst = args.client_burst if args.client_burst is not None else args.client_rate_limit
+    os.environ.update({"RENOGY_RATE_LIMIT": str(args.client_rate_limit), "RENOGY_RATE_BURST": str(client_burst)})
+    print(f"client governor: {args.client_rate_limit:g} req/s, burst {client_burst:g} "
+          f"(cycle floor ~{max(0.0, args.devices - client_burst) / args.client_rate_limit * 1000:.0f} ms "
+          f"for {args.devices} devices once the burst is spent)")
+    simulator = None
+    sim_url = args.sim_url
+    if not sim_url:
+        simulator = start_simulator(n_devices=args.devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                    error_rate=args.error_rate, rate_limit=args.rate_limit, seed=1)
+        sim_url = simulator.url
+
+    if args.target in ("lambda", "both"):
+        bench_lambda(sim_url, args.cycles)
+    if args.target in ("pi", "both"):
+        bench_pi(sim_url, args.cycles, build_fleet(args.devices))
+    if simulator:
+        print(f"simulator: {simulator.stats}")
+        simulator.shutdown()
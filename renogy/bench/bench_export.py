@@ -0,0 +1,90 @@
+"""
+Backfill benchmark: per-record run_plan() vs. column-wise export_history.
+
+Generates N days of 10-second raw samples for the canonical devices as a
+gzip'd JSON-lines file, checks that the vectorized transform matches
+process_device_data() value for value, then times a full raw -> Parquet export
+against the per-record transform of the same samples.
+
+    python3 renogy/bench/bench_export.py --days 30
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, ".."))
+sys.path.append(os.path.join(HERE, "..", "v2-aws"))
+from export_history import DayPartitionWriter, export, raw_chunks, read_capture_table, transform_raw_batch, transform_table
+from renogy_fields import CATEGORY_PLANS
+from renogy_ingest import _build_records
+from renogy_simulator import CANONICAL_DEVICES, sample_device
+from renogy_transform import run_plan
+
+
+def write_samples(path, days, interval=10, start=1_700_000_000):
+    rng = random.Random(1)
+    count = 0
+    with gzip.open(path, "wt") as f:
+        for ts in range(start, start + int(days * 86400), interval):
+            for device in CANONICAL_DEVICES:
+                f.write(json.dumps({"ts": ts, "device_id": device["deviceId"], "category": device["category"],
+                                    "data": sample_device(device, rng)}) + "\n")
+                count += 1
+    return count
+
+
+def per_record(samples):
+    """The live path minus logging: run_plan + record dicts for every sample."""
+    records = 0
+    for sample in samples:
+        prefix, plan = CATEGORY_PLANS[sample["category"]]
+        values = run_plan(plan, sample["data"], default=0.0)
+        records += len(_build_records(values.keys(), values.values(), sample["category"], sample["device_id"],
+                                      "", "", f"{prefix}-{sample['device_id'][-3:]}"))
+    return records
+
+
+def check_parity(samples, table):
+    """Both column paths (sample dicts and the Arrow capture table) against process_device_data."""
+    for chunk in (transform_raw_batch(samples, CATEGORY_PLANS), transform_table("lambda", table)):
+        got = {(int(t), d, s, m): v for t, d, s, m, v in
+               zip(chunk["time"], chunk["device"], chunk["sub"], chunk["measure"], chunk["value"])}
+        expected = 0
+        for sample in samples:
+            prefix, plan = CATEGORY_PLANS[sample["category"]]
+            uname = f"{prefix}-{sample['device_id'][-3:]}"
+            for (sub, measure), value in run_plan(plan, sample["data"], default=0.0).items():
+                assert got[(int(sample["ts"] * 1000), uname, sub, measure)] == value, (uname, sub, measure)
+                expected += 1
+        assert len(chunk["time"]) == expected, (len(chunk["time"]), expected)
+    return len(got)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raw sample export benchmark")
+    parser.add_argument("--days", type=float, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "samples.jsonl.gz")
+        n_samples = write_samples(path, args.days)
+        print(f"{n_samples} raw samples ({args.days:g} days x {len(CANONICAL_DEVICES)} devices at 10s)")
+
+        with gzip.open(path, "rt") as f:
+            head = [json.loads(next(f)) for _ in range(min(n_samples, 30_000))]
+        print(f"parity: {check_parity(head, read_capture_table(path).slice(0, len(head)))} values match process_device_data")
+
+        started = time.perf_counter()
+        with gzip.open(path, "rt") as f:
+            records = per_record(json.loads(line) for line in f)
+        per_record_s = time.perf_counter() - started
+        print(f"per-record : {records} records in {per_record_s:.2f}s ({records / per_record_s:,.0f}/s, no output written)")
+
+        rows, files, seconds = export(raw_chunks([path]), DayPartitionWriter(os.path.join(tmp, "out"), "raw"))
+        print(f"export     : {rows} rows in {seconds:.2f}s ({rows / seconds:,.0f}/s, {files} Parquet files)")
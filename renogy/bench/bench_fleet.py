@@ -0,0 +1,107 @@
+"""
+Fleet-mode scaling benchmark for the Lambda collector against the local simulator.
+
+Registers one simulator account per site, splits the sites over 1, 2, 4, ...
+shards with the consistent-hash ring and runs every shard at once (threads
+standing in for concurrent Lambda invocations, each with its own Fleet, sessions
+and governors). Reports aggregate polls/sec per shard count, scaling against one
+shard, and per-site collect times so a slow site (--slow-site-ms) can be seen
+not to delay the others.
+
+    python3 renogy/bench/bench_fleet.py --sites 16 --devices 6 --latency-ms 80
+    python3 renogy/bench/bench_fleet.py --sites 8 --shards 1 2 4 8 --slow-site-ms 2000
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, ".."))
+sys.path.append(os.path.join(BENCH_DIR, "..", "v2-aws"))
+
+from renogy_simulator import start_simulator
+from bench_end_to_end import RecordingCloudWatch, RecordingTimestream
+from renogy_fleet import Fleet, assign_sites, run_sites
+
+
+def build_registry(simulator, n_sites, slow_site_ms):
+    """One simulator account per site; site-0 gets the extra latency."""
+    sites = []
+    for i in range(n_sites):
+        name = f"site-{i}"
+        simulator.add_account(f"{name}-ak", f"{name}-sk", latency_ms=slow_site_ms if i == 0 else 0.0)
+        sites.append({"site": name, "host": simulator.url, "secret_name": name})
+    return sites
+
+
+def run_shards(renogy_ingest, sites, shards, site_workers, cycles):
+    """Run every shard concurrently for cycles; returns (elapsed, per-site collect times)."""
+    site_times = {}
+    lock = threading.Lock()
+
+    def timed_collect(site):
+        start = time.perf_counter()
+        result = renogy_ingest.collect_site(site)
+        with lock:
+            site_times.setdefault(site.name, []).append(time.perf_counter() - start)
+        return result
+
+    def shard_worker(shard):
+        fleet = Fleet(pool_size=renogy_ingest.MAX_WORKERS)
+        for _ in range(cycles):
+            run_sites(fleet.assign(sites, shard, shards), timed_collect, site_workers)
+
+    threads = [threading.Thread(target=shard_worker, args=(shard,)) for shard in range(shards)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return time.perf_counter() - start, site_times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fleet-mode scaling benchmark against the Renogy simulator")
+    parser.add_argument("--sites", type=int, default=8)
+    parser.add_argument("--devices", type=int, default=3, help="devices per site")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--site-workers", type=int, default=1, help="sites collected concurrently per shard")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--slow-site-ms", type=float, default=0.0, help="extra latency for every request of site-0")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    simulator = start_simulator(n_devices=args.devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=1)
+    sites = build_registry(simulator, args.sites, args.slow_site_ms)
+    os.environ.update({"RENOGY_HOST": simulator.url, "SOC_STATE_PATH": os.path.join(tempfile.gettempdir(), "bench_soc_state.json")})
+    import renogy_ingest
+
+    renogy_ingest.get_renogy_secrets = lambda secret_name=None: (f"{secret_name}-sk", f"{secret_name}-ak")
+    timestream = renogy_ingest.aws_clients["timestream-write"] = RecordingTimestream()
+    renogy_ingest.aws_clients["cloudwatch"] = RecordingCloudWatch()
+
+    baseline = None
+    print(f"{'shards':>6} {'sites/shard':>12} {'elapsed s':>10} {'polls/s':>9} {'scaling':>8} {'site p50 ms':>12} {'slowest site':>20}")
+    for shards in args.shards:
+        renogy_ingest.invalidate_cache()
+        per_shard = [len(assign_sites(sites, shard, shards)) for shard in range(shards)]
+        elapsed, site_times = run_shards(renogy_ingest, sites, shards, args.site_workers, args.cycles)
+        polls = args.sites * args.devices * args.cycles + args.sites
+        rate = polls / elapsed
+        baseline = baseline or rate / shards
+        p50 = statistics.median(t for times in site_times.values() for t in times) * 1000
+        slowest = max(site_times, key=lambda name: statistics.median(site_times[name]))
+        print(f"{shards:>6} {min(per_shard):>5}..{max(per_shard):<6} {elapsed:>10.2f} {rate:>9.1f} "
+              f"{rate / baseline:>7.1f}x {p50:>12.1f} {slowest:>10} {statistics.median(site_times[slowest]) * 1000:>7.0f} ms")
+    print(f"timestream: {timestream.calls} calls / {timestream.records} records, simulator: {simulator.stats}")
+    simulator.shutdown()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: linear next() scans vs. MeasurementStore lookups.
+
+Builds synthetic fleets of 3..600 devices through process_device_data() and times
+the 11 lookups per cycle (7 for derived load + 4 for CloudWatch) both ways. The store
+index is filled once while process_device_data() runs, so its build cost is reported
+separately from the lookups.
+
+    python3 renogy/bench/bench_measurement_store.py
+"""
+import contextlib
+import io
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "v2-aws"))
+from renogy_ingest import process_device_data
+from renogy_store import MeasurementStore
+
+LOOKUPS = [
+    ("shnt-258", "pri", "amps"), ("mppt-914", "pri", "amps"), ("shnt-071", "pri", "amps"),
+    ("shnt-258", "pri", "watt"), ("mppt-914", "pri", "watt"), ("shnt-071", "pri", "watt"),
+    ("shnt-071", "pri", "volt"),
+    ("shnt-071", "pri", "volt"), ("shnt-071", "pri", "amps"), ("mppt-914", "pri", "amps"), ("mppt-914", "pri", "volt"),
+]
+
+CONTROLLER_SAMPLE = {
+    "gridChargeAmps": 4190, "auxiliaryBatteryChargingVolts": 13.5, "solarWatts": 126.95,
+    "solarChargingVolts": 38.2, "solarChargingAmps": 3.3, "loadVolts": 13.4, "loadAmps": 0.2,
+    "auxiliaryBatteryTemperature": 21.0,
+}
+SHUNT_SAMPLE = {"batteryVolts": 13.283, "current": -4.92}
+
+
+def build_fleet(n_devices):
+    """Return the flattened transformed records for a synthetic fleet (real devices placed last)."""
+    ids = (f"4700000000000{i:06d}" for i in range(1000) if i not in (914, 71, 258))
+    fleet = [("Controller" if i % 3 == 0 else "Battery Shunt", next(ids)) for i in range(max(0, n_devices - 3))]
+    fleet += [("Battery Shunt", "4770000000000120258"), ("Controller", "4720000000000062914"), ("Battery Shunt", "4740000000000861071")]
+    records = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for category, device_id in fleet:
+            sample = CONTROLLER_SAMPLE if category == "Controller" else SHUNT_SAMPLE
+            records.extend(process_device_data(sample, category, device_id, "bench", "BENCH"))
+    return records
+
+
+def linear_lookups(records):
+    return [next(item for item in records if item["uname"] == u and item["sub"] == s and item["measure"] == m)["value"]
+            for u, s, m in LOOKUPS]
+
+
+def store_lookups(store):
+    return [store.value(u, s, m) for u, s, m in LOOKUPS]
+
+
+if __name__ == "__main__":
+    print(f"{'devices':>8} {'records':>8} {'linear us':>10} {'lookup us':>10} {'build us':>10} {'speedup':>8}")
+    for n_devices in (3, 10, 30, 100, 300, 600):
+        records = build_fleet(n_devices)
+        store = MeasurementStore(records)
+        assert linear_lookups(records) == store_lookups(store)
+        number = max(20, 20000 // len(records))
+        linear = min(timeit.repeat(lambda: linear_lookups(records), number=number, repeat=5)) / number * 1e6
+        lookup = min(timeit.repeat(lambda: store_lookups(store), number=number, repeat=5)) / number * 1e6
+        build = min(timeit.repeat(lambda: MeasurementStore(records), number=number, repeat=5)) / number * 1e6
+        print(f"{n_devices:>8} {len(records):>8} {linear:>10.1f} {lookup:>10.1f} {build:>10.1f} {linear / lookup:>7.0f}x")
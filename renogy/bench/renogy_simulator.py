@@ -0,0 +1,229 @@
+"""
+Local stand-in for the Renogy OpenAPI (openapi.renogy.com).
+
+Implements /device/list and /device/data/latest/{id} with the same calc_sign
+HMAC verification as the collectors, plus configurable fleet size, latency,
+error rate and per-access-key rate limiting (429 + Retry-After). Extra accounts
+(access keys) with their own added latency can be registered with add_account()
+to stand in for a fleet of sites.
+
+    python3 renogy/bench/renogy_simulator.py --devices 50 --latency-ms 80 --error-rate 0.01 --rate-limit 20
+    RENOGY_HOST=http://127.0.0.1:8181 ACCESS_KEY=sim-ak SECRET_KEY=sim-sk python3 renogy/renogyquery.py
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+DEFAULT_ACCESS_KEY = "sim-ak"
+DEFAULT_SECRET_KEY = "sim-sk"
+
+# The devices the collectors special-case (derived load, CloudWatch, DEVICES in .env.example)
+CANONICAL_DEVICES = [
+    {"deviceId": "4720000000000062914", "category": "Controller", "name": "Solar", "sku": "RNG-CTRL-ROVER60"},
+    {"deviceId": "4740000000000861071", "category": "Battery Shunt", "name": "Main", "sku": "RSHST-B02P300-G1"},
+    {"deviceId": "4770000000000120258", "category": "Battery Shunt", "name": "Inverter", "sku": "RSHST-B02P300-G1"},
+]
+
+
+def calc_sign(ts, url, param_str, secret):
+    """Calculate the signature (same scheme as the collectors)."""
+    to_sign = f"{ts}.{url}.{param_str}"
+    hashed = hmac.new(secret.encode(), to_sign.encode(), hashlib.sha256).digest()
+    return base64.b64encode(hashed).decode()
+
+
+def build_fleet(n_devices):
+    """Canonical devices first, then synthetic controllers/shunts with unique 3-digit suffixes."""
+    fleet = [dict(d) for d in CANONICAL_DEVICES[:n_devices]]
+    suffixes = (i for i in range(1000) if i not in (914, 71, 258))
+    for i in range(len(fleet), n_devices):
+        category = "Controller" if i % 3 == 0 else "Battery Shunt"
+        fleet.append({
+            "deviceId": f"47{i // 1000:014d}{next(suffixes):03d}",
+            "category": category,
+            "name": f"Sim{i}",
+            "sku": "RNG-CTRL-ROVER60" if category == "Controller" else "RSHST-B02P300-G1",
+        })
+    return fleet
+
+
+def sample_device(device, rng):
+    """Plausible latest-data payload for a device."""
+    if device["category"] == "Controller":
+        solar_volts = rng.uniform(30, 40)
+        solar_amps = rng.uniform(0, 10)
+        return {
+            "solarWatts": round(solar_volts * solar_amps, 2),
+            "solarChargingVolts": round(solar_volts, 2),
+            "solarChargingAmps": round(solar_amps, 2),
+            "auxiliaryBatteryChargingVolts": round(rng.uniform(13.0, 14.4), 2),
+            "gridChargeAmps": round(rng.uniform(0, 30000)),
+            "loadVolts": round(rng.uniform(12.8, 13.6), 2),
+            "loadAmps": round(rng.uniform(0, 2), 2),
+            "auxiliaryBatteryTemperature": round(rng.uniform(10, 30), 1),
+        }
+    return {"batteryVolts": round(rng.uniform(12.8, 13.6), 3), "current": round(rng.uniform(-40, 40), 2)}
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Return 0 if a token was taken, else seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class RenogySimulator(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, n_devices=3, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit=0.0, burst=None, access_key=DEFAULT_ACCESS_KEY, secret_key=DEFAULT_SECRET_KEY, seed=None):
+        super().__init__(address, _Handler)
+        self.fleet = build_fleet(n_devices)
+        self.by_id = {d["deviceId"]: d for d in self.fleet}
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst or max(1, rate_limit)
+        self.keys = {access_key: secret_key}
+        self.key_latency = {}  # access key -> extra seconds per request (slow sites)
+        self.buckets = {}
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "ok": 0, "unauthorized": 0, "throttled": 0, "errors": 0, "not_found": 0}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def add_account(self, access_key, secret_key, latency_ms=0.0):
+        """Accept another access key (one fleet site), optionally slower than the rest."""
+        self.keys[access_key] = secret_key
+        if latency_ms:
+            self.key_latency[access_key] = latency_ms / 1000
+
+    def bucket(self, access_key):
+        if access_key not in self.buckets:
+            self.buckets[access_key] = _TokenBucket(self.rate_limit, self.burst)
+        return self.buckets[access_key]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like openapi.renogy.com
+    # Headers and body go out as separate writes; with Nagle on, the body waits for the
+    # client's delayed ACK (~40 ms) on every reused connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        sim = self.server
+        sim.count("requests")
+        parts = urlsplit(self.path)
+
+        if sim.latency or sim.jitter:
+            time.sleep(sim.latency + sim.rng.uniform(0, sim.jitter))
+
+        access_key = self.headers.get("Access-Key", "")
+        secret = sim.keys.get(access_key)
+        expected = secret and calc_sign(self.headers.get("Timestamp", ""), parts.path, parts.query, secret)
+        if not expected or not hmac.compare_digest(expected, self.headers.get("Signature", "")):
+            sim.count("unauthorized")
+            return self._reply(401, {"code": 401, "message": "signature verification failed"})
+        if access_key in sim.key_latency:
+            time.sleep(sim.key_latency[access_key])
+
+        if sim.rate_limit:
+            wait = sim.bucket(access_key).take()
+            if wait:
+                sim.count("throttled")
+                return self._reply(429, {"code": 429, "message": "too many requests"},
+                                   {"Retry-After": f"{max(1, round(wait))}"})
+
+        if sim.error_rate and sim.rng.random() < sim.error_rate:
+            sim.count("errors")
+            return self._reply(500, {"code": 500, "message": "simulated error"})
+
+        if parts.path == "/device/list":
+            sim.count("ok")
+            hub = {"deviceId": "4700000000000000001", "name": "Renogy One Core", "sublist": sim.fleet}
+            return self._reply(200, [hub])
+
+        if parts.path.startswith("/device/data/latest/"):
+            device = sim.by_id.get(parts.path.rsplit("/", 1)[-1])
+            if device is None:
+                sim.count("not_found")
+                return self._reply(404, {"code": 404, "message": "device not found"})
+            sim.count("ok")
+            return self._reply(200, {"code": 200, "data": sample_device(device, sim.rng)})
+
+        sim.count("not_found")
+        self._reply(404, {"code": 404, "message": "not found"})
+
+
+def start_simulator(host="127.0.0.1", port=0, **options):
+    """Start a simulator on a background thread; returns the server (see .url, .stats, .shutdown())."""
+    server = RenogySimulator((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="renogy-simulator", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Renogy OpenAPI simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--devices", type=int, default=3, help="fleet size (first 3 match .env.example)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/sec per access key (0 = unlimited)")
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument("--access-key", default=DEFAULT_ACCESS_KEY)
+    parser.add_argument("--secret-key", default=DEFAULT_SECRET_KEY)
+    args = parser.parse_args()
+
+    server = RenogySimulator(
+        (args.host, args.port), n_devices=args.devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, burst=args.burst,
+        access_key=args.access_key, secret_key=args.secret_key,
+    )
+    print(f"Renogy simulator on {server.url} with {len(server.fleet)} devices")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
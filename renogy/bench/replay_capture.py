@@ -0,0 +1,169 @@
+"""
+Replay captured raw API responses through the collector hot path.
+
+Feeds capture files (RAW_CAPTURE_DIR in either collector) cycle by cycle, as
+fast as possible, through the collectors' own per-cycle step:
+  lambda: renogy_ingest.process_samples (records, derived metrics, SoC, deadband,
+          Timestream with write_records stubbed, rollups, CloudWatch EMF)
+  pi:     renogyquery.process_cycle (transforms, SoC, deadband, InfluxDB writer
+          stubbed to line protocol, rollups)
+with the deadband and rollups on (DEADBAND_RULES / ROLLUP_WINDOWS below unless set),
+and reports records/sec plus allocations per sample (tracemalloc peak KB and
+blocks still held after the replay). --min-rate / --max-alloc-kb exit 1 when missed,
+so the replay can gate hot-path regressions without hardware or cloud access.
+
+    python3 renogy/bench/replay_capture.py /var/lib/renogy/capture/pi-*.jsonl.gz
+    python3 renogy/bench/replay_capture.py --generate 20000 --min-rate 2000 --max-alloc-kb 32
+"""
+import argparse
+import contextlib
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, ".."))
+sys.path.append(os.path.join(BENCH_DIR, "..", "v2-aws"))
+
+from bench_end_to_end import RecordingTimestream
+from renogy_capture import RawCapture, read_capture
+from renogy_simulator import CANONICAL_DEVICES, sample_device
+from renogy_soc import SocEstimator
+from renogy_deadband import filter_from_env
+from renogy_rollup import RollupEngine
+
+LAMBDA_DEADBAND_RULES = "volt:0.02,amps:0.1,watt:2%,temp:0.5,soc:0.1"
+PI_DEADBAND_RULES = "Volts*:0.02,Amps*:0.1,Watts*:2%,BatteryTemp:0.5,SoC:0.1,AhRemaining:0.5,Wh*:1"
+
+
+def generate_capture(directory, cycles, interval=10, start=1_700_000_000):
+    """Write a synthetic capture of the canonical devices (same format as RawCapture in the collectors)."""
+    rng = random.Random(1)
+    capture = RawCapture(directory, prefix="generated", max_files=0)
+    for cycle in range(cycles):
+        ts = start + cycle * interval
+        capture.write([
+            {"ts": ts, "device_id": d["deviceId"], "category": d["category"], "name": d["name"], "sku": d["sku"],
+             "data": sample_device(d, rng)}
+            for d in CANONICAL_DEVICES
+        ])
+    capture.close()
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def load_cycles(paths):
+    """Captured samples grouped into collection cycles (consecutive samples sharing a timestamp)."""
+    return [list(group) for _, group in itertools.groupby(read_capture(paths), key=lambda s: s["ts"])]
+
+
+def lambda_replay():
+    os.environ.setdefault("DEADBAND_RULES", LAMBDA_DEADBAND_RULES)
+    os.environ.setdefault("ROLLUP_WINDOWS", "900,3600")
+    import renogy_ingest as ri
+
+    timestream = ri.aws_clients["timestream-write"] = RecordingTimestream()
+
+    def reset():
+        # Fresh state per pass, with no SoC persistence while replaying
+        ri._soc_estimator = SocEstimator()
+        ri.derived_engine = ri.build_derived_engine()
+        ri.deadband = filter_from_env()
+        if ri.rollup_engine:
+            ri.rollup_engine = RollupEngine(ri.ROLLUP_WINDOWS, max_gap=ri.rollup_engine.max_gap)
+
+    def run(cycle):
+        ri.process_samples(cycle, cycle[0]["ts"])
+    return run, lambda: timestream.records, reset
+
+
+def pi_replay():
+    os.environ.setdefault("INFLUX_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("DEADBAND_RULES", PI_DEADBAND_RULES)
+    os.environ.setdefault("ROLLUP_WINDOWS", "60,900,3600")
+    os.environ.update({"INFLUX_SPOOL_PATH": "", "RAW_CAPTURE_DIR": "", "METRICS_PORT": "0",
+                       "SOC_STATE_PATH": os.path.join(tempfile.gettempdir(), "replay_soc_state.json")})
+    import renogyquery as rq
+
+    lines = [0]
+
+    def write(points):
+        lines[0] += sum(1 for point in points if point.to_line_protocol())
+    rq.influx_writer.write = write
+
+    def reset():
+        rq.soc_estimator = SocEstimator()
+        rq.deadband = filter_from_env()
+        rq.rollup_state.clear()
+
+    def run(cycle):
+        rq.process_cycle(cycle, cycle[0]["ts"])
+    return run, lambda: lines[0], reset
+
+
+def replay(name, run, written, reset, cycles, samples):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        reset()
+        before = written()
+        started = time.perf_counter()
+        for cycle in cycles:
+            run(cycle)
+        seconds = time.perf_counter() - started
+        records = written() - before
+
+        # Second pass under tracemalloc (slower, so not timed): peak bytes allocated within each cycle
+        reset()
+        tracemalloc.start()
+        cycle_peaks = 0
+        base_blocks = sys.getallocatedblocks()
+        for cycle in cycles:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            run(cycle)
+            cycle_peaks += tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+        retained_blocks = sys.getallocatedblocks() - base_blocks
+
+    rate = samples / seconds
+    alloc_kb = cycle_peaks / 1024 / samples
+    print(f"{name:>7}: {samples} samples, {records} records in {seconds:.2f}s -> {records / seconds:,.0f} records/s, "
+          f"{rate:,.0f} samples/s; allocations: {alloc_kb:.2f} KB peak/sample, "
+          f"{retained_blocks / samples:.2f} blocks retained/sample")
+    return rate, alloc_kb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured Renogy responses through transforms and writers")
+    parser.add_argument("paths", nargs="*", help="capture files (*.jsonl.gz)")
+    parser.add_argument("--generate", type=int, metavar="CYCLES", help="replay a synthetic capture of N cycles instead")
+    parser.add_argument("--target", choices=("lambda", "pi", "both"), default="both")
+    parser.add_argument("--min-rate", type=float, help="fail if samples/s falls below this")
+    parser.add_argument("--max-alloc-kb", type=float, help="fail if peak KB allocated per sample exceeds this")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate_capture(tmp, args.generate) if args.generate else args.paths
+        if not paths:
+            parser.error("give capture files or --generate N")
+        cycles = load_cycles(paths)
+    samples = sum(len(cycle) for cycle in cycles)
+    print(f"{samples} captured samples in {len(cycles)} cycles")
+
+    failures = []
+    targets = ("lambda", "pi") if args.target == "both" else (args.target,)
+    for target in targets:
+        run, written, reset = lambda_replay() if target == "lambda" else pi_replay()
+        rate, alloc_kb = replay(target, run, written, reset, cycles, samples)
+        if args.min_rate and rate < args.min_rate:
+            failures.append(f"{target}: {rate:,.0f} samples/s < {args.min_rate:,.0f}")
+        if args.max_alloc_kb and alloc_kb > args.max_alloc_kb:
+            failures.append(f"{target}: {alloc_kb:.2f} KB/sample > {args.max_alloc_kb}")
+
+    if failures:
+        print("REGRESSION: " + "; ".join(failures))
+        sys.exit(1)
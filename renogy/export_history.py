@@ -0,0 +1,447 @@
+"""
+Backfill/export Renogy history to day-partitioned Parquet or Arrow files.
+
+Streams one source in bounded chunks (one query window or N lines at a time),
+builds NumPy columns (raw capture files are parsed by Arrow's JSON reader), runs
+raw API samples through the collector transforms column-wise
+(renogy_transform.run_plan_columns) and writes compressed files
+to <out>/date=YYYY-MM-DD/<source>-<first sample ms>-<seq>.parquet|arrow
+(existing files are never overwritten, so export into an empty --out).
+
+Every source is exported in one long schema: time (UTC), device, sub, measure, value,
+site (the fleet site tag/dimension; empty outside fleet mode).
+
+    python3 export_history.py influx --start 2024-01-01 --end 2025-01-01 --out history/
+    python3 export_history.py timestream --db nomad_oracle --table renogy_data --start 2024-12-01 --out history/
+    python3 export_history.py spool /var/lib/renogy/influx_spool.lp --out history/
+    python3 export_history.py raw samples-*.jsonl.gz --out history/ --format arrow
+
+Raw sample files are JSON lines (optionally gzip'd), one API response per line, as
+written by renogy_capture.RawCapture (RAW_CAPTURE_DIR in either collector):
+{"ts": <epoch seconds>, "device_id": "...", "category": "Controller", "name": "...", "data": {<raw fields>}}.
+Files captured by the Pi (pi-*.jsonl.gz) go through the Pi field tables (device =
+Solar/Main/Inverter, fields VoltsMain, ...), all others through the Lambda measure
+tables (device = mppt-xxx/shnt-xxx, sub/measure); --transform overrides the choice.
+Requires numpy and pyarrow (pip install numpy pyarrow).
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from renogy_aws import DIMENSION_KEYS, OPTIONAL_DIMENSION_KEYS
+from renogy_capture import read_capture
+from renogy_fields import CATEGORY_PLANS, DEVICE_PLANS
+from renogy_transform import run_plan_columns
+
+DAY_MS = 86_400_000
+SCHEMA = pa.schema([
+    ("time", pa.timestamp("ms", tz="UTC")),
+    ("device", pa.string()),
+    ("sub", pa.string()),
+    ("measure", pa.string()),
+    ("value", pa.float64()),
+    ("site", pa.string()),
+])
+
+
+####################
+# CHUNKS: {"time": int64 ms, "device"/"sub"/"measure"/"site": object, "value": float64} arrays
+####################
+def make_chunk(times_ms, devices, subs, measures, values, sites=None):
+    return {
+        "time": np.asarray(times_ms, dtype=np.int64),
+        "device": np.asarray(devices, dtype=object),
+        "sub": np.asarray(subs, dtype=object),
+        "measure": np.asarray(measures, dtype=object),
+        "value": np.asarray(values, dtype=float),
+        "site": np.asarray([""] * len(times_ms) if sites is None else sites, dtype=object),
+    }
+
+
+def parse_times_ms(strings):
+    """ISO-8601 / Timestream timestamp strings -> int64 ms since epoch (parsed by Arrow in one pass)."""
+    strings = pa.array(strings, pa.string())
+    try:
+        times = strings.cast(pa.timestamp("ns", tz="UTC"))
+    except pa.ArrowInvalid:
+        times = strings.cast(pa.timestamp("ns"))  # Timestream: UTC without a zone offset
+    return times.cast(pa.int64()).to_numpy(zero_copy_only=False) // 1_000_000
+
+
+def time_windows(start, end, window):
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        yield window_start, window_end
+        window_start = window_end
+
+
+####################
+# SOURCES
+####################
+def influx_chunks(start, end, window, measurement="PowerMonitoring", bucket=None):
+    """Pi history from InfluxDB, one Flux query per window read as a CSV stream."""
+    from influxdb_client import Dialect, InfluxDBClient
+
+    load_dotenv("/usr/local/etc/renogy/renogy.env")
+    bucket = bucket or os.getenv("INFLUX_BUCKET")
+    client = InfluxDBClient(url=os.getenv("INFLUX_URL"), token=os.getenv("INFLUX_TOKEN"), org=os.getenv("INFLUX_ORG"))
+    query_api = client.query_api()
+    try:
+        for window_start, window_end in time_windows(start, end, window):
+            query = (
+                f'from(bucket: "{bucket}") '
+                f'|> range(start: {window_start.isoformat()}, stop: {window_end.isoformat()}) '
+                f'|> filter(fn: (r) => r._measurement == "{measurement}") '
+                f'|> keep(columns: ["_time", "device", "site", "_field", "_value"])'
+            )
+            times, devices, measures, values, sites = [], [], [], [], []
+            columns = None
+            for row in query_api.query_csv(query, dialect=Dialect(header=True, annotations=[])):
+                if not row:
+                    continue  # blank line between tables
+                if "_time" in row:
+                    columns = {name: i for i, name in enumerate(row)}  # (repeated) table header
+                    continue
+                times.append(row[columns["_time"]])
+                devices.append(row[columns["device"]])
+                measures.append(row[columns["_field"]])
+                values.append(row[columns["_value"]])
+                sites.append(row[columns["site"]] if "site" in columns else "")  # only fleet-mode tables have it
+            if times:
+                yield make_chunk(parse_times_ms(times), devices, [""] * len(times), measures,
+                                 np.array(values, dtype=object).astype(float), sites)
+    finally:
+        client.close()
+
+
+def timestream_chunks(start, end, window, db, table):
+    """
+    Lambda history from Timestream, paginated per window. Works on SINGLE tables
+    (measure_name + measure_value::double) and MULTI tables (one column per
+    measure); the site dimension is kept when records have it.
+    """
+    import boto3
+
+    dimensions = set(DIMENSION_KEYS + OPTIONAL_DIMENSION_KEYS)
+    query_client = boto3.client("timestream-query")
+    for window_start, window_end in time_windows(start, end, window):
+        query = (
+            f'SELECT * FROM "{db}"."{table}" '
+            f"WHERE time >= from_iso8601_timestamp('{window_start.isoformat()}') "
+            f"AND time < from_iso8601_timestamp('{window_end.isoformat()}')"
+        )
+        times, devices, subs, measures, values, sites = [], [], [], [], [], []
+        for page in query_client.get_paginator("query").paginate(QueryString=query):
+            names = [column["Name"] for column in page["ColumnInfo"]]
+            value_columns = [(i, name) for i, name in enumerate(names)
+                             if name not in dimensions and name not in ("time", "measure_name")]
+            for row in page["Rows"]:
+                cells = {name: cell.get("ScalarValue") for name, cell in zip(names, row["Data"])}
+                for i, name in value_columns:
+                    value = row["Data"][i].get("ScalarValue")
+                    if value is None:
+                        continue
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        continue  # varchar/boolean measures
+                    times.append(cells["time"])
+                    devices.append(cells.get("uname") or "")
+                    subs.append(cells.get("sub") or "")
+                    # SINGLE: the value sits in measure_value::<type>; MULTI: the column is the measure
+                    measures.append(cells["measure_name"] if name.startswith("measure_value::") else name)
+                    values.append(value)
+                    sites.append(cells.get("site") or "")
+        if times:
+            yield make_chunk(parse_times_ms(times), devices, subs, measures, values, sites)
+
+
+def spool_chunks(paths, chunk_lines=200_000):
+    """Line protocol spooled by renogy_influx.InfluxWriter (timestamps in seconds)."""
+    times, devices, measures, values, sites = [], [], [], [], []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split(" ")
+                if len(parts) != 3:
+                    continue
+                series, fields, ts = parts
+                tags = dict(tag.split("=", 1) for tag in series.split(",")[1:] if "=" in tag)
+                device, site = tags.get("device", ""), tags.get("site", "")
+                ts_ms = int(ts) * 1000
+                for field in fields.split(","):
+                    key, _, value = field.partition("=")
+                    if value.endswith("i"):
+                        value = value[:-1]
+                    try:
+                        values.append(float(value))
+                    except ValueError:
+                        continue  # string/boolean fields
+                    times.append(ts_ms)
+                    devices.append(device)
+                    measures.append(key)
+                    sites.append(site)
+                if len(times) >= chunk_lines:
+                    yield make_chunk(times, devices, [""] * len(times), measures, values, sites)
+                    times, devices, measures, values, sites = [], [], [], [], []
+    if times:
+        yield make_chunk(times, devices, [""] * len(times), measures, values, sites)
+
+
+def raw_chunks(paths, transform="auto", chunk_samples=50_000):
+    """
+    Raw API responses transformed column-wise with the tables of the collector
+    that captured them (transform "auto": pi-* files -> Pi, others -> Lambda).
+    Complete capture files are parsed by Arrow straight into typed columns; a file
+    Arrow can't read (still being written, mixed value types) goes through json.
+    """
+    batches = {"pi": [], "lambda": []}
+    for path in paths:
+        target = transform
+        if target == "auto":
+            target = "pi" if os.path.basename(path).startswith("pi-") else "lambda"
+        table = read_capture_table(path)
+        if table is not None:
+            for offset in range(0, table.num_rows, chunk_samples):
+                yield transform_table(target, table.slice(offset, chunk_samples))
+            continue
+        batch = batches[target]
+        for sample in read_capture([path]):
+            batch.append(sample)
+            if len(batch) >= chunk_samples:
+                yield transform_batch(target, batch)
+                batch.clear()
+    for target, batch in batches.items():
+        if batch:
+            yield transform_batch(target, batch)
+
+
+def read_capture_table(path):
+    """A capture file parsed by Arrow's JSON reader (data = struct of raw fields), or None if Arrow can't."""
+    try:
+        return pa_json.read_json(pa.input_stream(path))  # .gz is decompressed by extension
+    except (pa.ArrowInvalid, OSError, EOFError):
+        return None
+
+
+def transform_batch(target, samples):
+    return transform_pi_batch(samples) if target == "pi" else transform_raw_batch(samples, CATEGORY_PLANS)
+
+
+def transform_table(target, table):
+    """Arrow counterpart of transform_batch: same grouping, plans and defaults as the record path."""
+    if target == "pi":
+        return _transform_table(table, ["name"], DEVICE_PLANS, lambda key: (DEVICE_PLANS[key[0]], key[0]), np.nan)
+
+    def plan_for(key):
+        category, device_id = key
+        prefix, plan = CATEGORY_PLANS[category]
+        return plan, f"{prefix}-{device_id[-3:]}"
+
+    return _transform_table(table, ["category", "device_id"], CATEGORY_PLANS, plan_for, 0.0)
+
+
+def _plan_chunks(plan, device, times_ms, sites, columns):
+    """Run a plan once over one device's columns ({raw_field: float64 array}); yields chunks per output."""
+    for key, values in run_plan_columns(plan, columns).items():
+        sub, measure = key if isinstance(key, tuple) else ("", key)
+        keep = ~np.isnan(values)
+        count = int(keep.sum())
+        yield make_chunk(times_ms[keep], np.full(count, device, dtype=object), np.full(count, sub, dtype=object),
+                         np.full(count, measure, dtype=object), values[keep], sites[keep])
+
+
+def _record_chunks(group, plan, device, default):
+    """_plan_chunks over sample dicts (one NumPy column per raw field)."""
+    times_ms = (np.array([s["ts"] for s in group], dtype=float) * 1000).astype(np.int64)
+    sites = np.array([s.get("site", "") for s in group], dtype=object)
+    fields = {source for _, sources, _, _ in plan for source in sources}
+    columns = {field: np.array([s["data"].get(field, default) for s in group], dtype=object).astype(float)
+               for field in fields}
+    return _plan_chunks(plan, device, times_ms, sites, columns)
+
+
+def _transform_table(table, keys, plans, plan_for, default):
+    """Group a capture table by keys (row indices per group, in Arrow) and run each device's plan once."""
+    if any(key not in table.column_names for key in keys) or "data" not in table.column_names:
+        return _concat([])
+    rows = table.select(keys).append_column("row", pa.array(np.arange(table.num_rows)))
+    groups = rows.group_by(keys, use_threads=False).aggregate([("row", "list")])
+    data_type = table.schema.field("data").type
+    parts = []
+    for i, key in enumerate(zip(*(groups[k].to_pylist() for k in keys))):
+        if key[0] not in plans:
+            continue
+        group = table.take(groups["row_list"][i].values)
+        plan, device = plan_for(key)
+        times_ms = (group["ts"].cast(pa.float64()).to_numpy() * 1000).astype(np.int64)
+        if "site" in group.column_names:
+            sites = group["site"].cast(pa.string()).fill_null("").to_numpy().astype(object)
+        else:
+            sites = np.full(group.num_rows, "", dtype=object)
+        columns = {}
+        for field in {source for _, sources, _, _ in plan for source in sources}:
+            if data_type.get_field_index(field) < 0:
+                columns[field] = np.full(group.num_rows, default)  # no sample in the file has it
+                continue
+            column = pc.struct_field(group["data"], field).cast(pa.float64())
+            if not np.isnan(default):
+                column = column.fill_null(default)
+            columns[field] = column.to_numpy()  # nulls come out as NaN
+        parts.extend(_plan_chunks(plan, device, times_ms, sites, columns))
+    return _concat(parts)
+
+
+def _concat(parts):
+    if not parts:
+        return make_chunk([], [], [], [], [])
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def transform_raw_batch(samples, plans):
+    """Lambda tables: group raw samples by device and run each category plan once per device."""
+    by_device = {}
+    for sample in samples:
+        if sample.get("category") in plans:
+            by_device.setdefault((sample["category"], sample["device_id"]), []).append(sample)
+
+    parts = []
+    for (category, device_id), group in by_device.items():
+        prefix, plan = plans[category]
+        # Missing raw fields read as 0.0, matching process_device_data's default
+        parts.extend(_record_chunks(group, plan, f"{prefix}-{device_id[-3:]}", 0.0))
+    return _concat(parts)
+
+
+def transform_pi_batch(samples, plans=DEVICE_PLANS):
+    """Pi field tables: group raw samples by device name (Solar/Main/Inverter); missing fields are skipped."""
+    by_device = {}
+    for sample in samples:
+        if sample.get("name") in plans:
+            by_device.setdefault(sample["name"], []).append(sample)
+
+    parts = []
+    for name, group in by_device.items():
+        parts.extend(_record_chunks(group, plans[name], name, np.nan))
+    return _concat(parts)
+
+
+####################
+# DAY-PARTITIONED WRITER
+####################
+class DayPartitionWriter:
+    """Write chunks as compressed Parquet/Arrow files under date=YYYY-MM-DD/ directories."""
+
+    def __init__(self, out_dir, source, fmt="parquet", compression="zstd"):
+        self.out_dir = out_dir
+        self.source = source
+        self.fmt = fmt
+        self.compression = compression
+        self.rows = 0
+        self.files = 0
+
+    def write(self, chunk):
+        if not len(chunk["time"]):
+            return
+        order = np.argsort(chunk["time"], kind="stable")
+        chunk = {key: column[order] for key, column in chunk.items()}
+        days = chunk["time"] // DAY_MS
+        # Sorted by time, so each day is one contiguous slice
+        boundaries = np.flatnonzero(np.diff(days)) + 1
+        for lo, hi in zip(np.r_[0, boundaries], np.r_[boundaries, len(days)]):
+            self._write_day(int(days[lo]), {key: column[lo:hi] for key, column in chunk.items()})
+
+    def _write_day(self, day, chunk):
+        date = datetime.fromtimestamp(day * 86400, timezone.utc).strftime("%Y-%m-%d")
+        directory = os.path.join(self.out_dir, f"date={date}")
+        os.makedirs(directory, exist_ok=True)
+        table = pa.table({
+            "time": pa.array(chunk["time"], pa.int64()).cast(SCHEMA.field("time").type),
+            "device": pa.array(chunk["device"], pa.string()),
+            "sub": pa.array(chunk["sub"], pa.string()),
+            "measure": pa.array(chunk["measure"], pa.string()),
+            "value": pa.array(chunk["value"], pa.float64()),
+            "site": pa.array(chunk["site"], pa.string()),
+        }, schema=SCHEMA)
+        with self._create(directory, int(chunk["time"][0])) as sink:
+            if self.fmt == "parquet":
+                pq.write_table(table, sink, compression=self.compression, use_dictionary=["device", "sub", "measure"])
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                with pa.ipc.new_file(sink, SCHEMA, options=options) as writer:
+                    writer.write_table(table)
+        self.rows += table.num_rows
+        self.files += 1
+
+    def _create(self, directory, first_ms):
+        """
+        Open <source>-<first sample ms>-<seq> exclusively: chunks starting on the same
+        millisecond (or files left by another run) get the next sequence number
+        instead of overwriting each other.
+        """
+        seq = 0
+        while True:
+            path = os.path.join(directory, f"{self.source}-{first_ms}-{seq}.{self.fmt}")
+            try:
+                return open(path, "xb")
+            except FileExistsError:
+                seq += 1
+
+
+def export(chunks, writer):
+    """Drain a chunk iterator into the writer; returns (rows, files, seconds)."""
+    started = time.perf_counter()
+    for chunk in chunks:
+        writer.write(chunk)
+        print(f"  {writer.rows} rows, {writer.files} files ({time.perf_counter() - started:.1f}s)")
+    return writer.rows, writer.files, time.perf_counter() - started
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Renogy history to day-partitioned Parquet/Arrow")
+    parser.add_argument("source", choices=["influx", "timestream", "spool", "raw"])
+    parser.add_argument("paths", nargs="*", help="spool or raw sample files")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--compression", default="zstd")
+    parser.add_argument("--start", type=_parse_date, help="UTC start for influx/timestream, e.g. 2024-01-01")
+    parser.add_argument("--end", type=_parse_date, default=datetime.now(timezone.utc), help="UTC end (default now)")
+    parser.add_argument("--window-hours", type=float, default=24, help="query window size (bounds memory)")
+    parser.add_argument("--bucket", help="InfluxDB bucket (default INFLUX_BUCKET)")
+    parser.add_argument("--measurement", default="PowerMonitoring")
+    parser.add_argument("--db", default="nomad_oracle")
+    parser.add_argument("--table", default="renogy_data")
+    parser.add_argument("--transform", choices=["auto", "pi", "lambda"], default="auto",
+                        help="field tables for raw samples (auto: pi-* capture files -> Pi, others -> Lambda)")
+    args = parser.parse_args()
+
+    window = timedelta(hours=args.window_hours)
+    if args.source in ("influx", "timestream") and not args.start:
+        parser.error(f"--start is required for {args.source}")
+    if args.source in ("spool", "raw") and not args.paths:
+        parser.error(f"{args.source} needs one or more files")
+
+    if args.source == "influx":
+        chunks = influx_chunks(args.start, args.end, window, args.measurement, args.bucket)
+    elif args.source == "timestream":
+        chunks = timestream_chunks(args.start, args.end, window, args.db, args.table)
+    elif args.source == "spool":
+        chunks = spool_chunks(args.paths)
+    else:
+        chunks = raw_chunks(args.paths, args.transform)
+
+    rows, files, seconds = export(chunks, DayPartitionWriter(args.out, args.source, args.format, args.compression))
+    print(f"Exported {rows} rows to {files} files in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
@@ -0,0 +1,208 @@
+####################
+# SHARED AWS HELPERS
+# Used by the Renogy and Peplink Lambdas without importing each other: lazily
+# built boto3 clients, a TTL cache kept across warm invocations, JSON state in
+# S3, and the chunked Timestream writer (100-record requests with shared time
+# and dimensions hoisted into CommonAttributes, RejectedRecords retried).
+#####################
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Client build times, logged with the Lambda's cold-start profile
+startup_timings = {}
+
+# boto3 is imported and each client built on first use, then reused across warm invocations
+aws_clients = {}
+_aws_clients_lock = threading.Lock()
+
+def get_aws_client(service):
+    """Return the shared boto3 client for a service, creating it on first use."""
+    client = aws_clients.get(service)
+    if client is None:
+        with _aws_clients_lock:
+            client = aws_clients.get(service)
+            if client is None:
+                started = time.perf_counter()
+                import boto3
+                client = aws_clients[service] = boto3.client(service)
+                startup_timings[f"client:{service}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return client
+
+# Warm-invocation cache (secrets, device inventory, ...): {key: (expires_at, value)}
+CACHE_TTL_SECRETS = float(os.getenv("CACHE_TTL_SECRETS", 3600))
+_cache = {}
+cache_stats = {}  # {key: {"hits": n, "misses": n, "invalidations": n}}
+
+def cached(key, ttl, loader):
+    """Return the cached value for key, calling loader on a miss or after ttl seconds (empty results aren't cached)."""
+    stats = cache_stats.setdefault(key, {"hits": 0, "misses": 0, "invalidations": 0})
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry and entry[0] > now:
+        stats["hits"] += 1
+        return entry[1]
+    stats["misses"] += 1
+    value = loader()
+    if value:
+        _cache[key] = (now + ttl, value)
+    return value
+
+def invalidate_cache(*keys):
+    """Drop the given cache keys (all keys if none given)."""
+    for key in keys or list(_cache):
+        if _cache.pop(key, None) is not None:
+            cache_stats.setdefault(key, {"hits": 0, "misses": 0, "invalidations": 0})["invalidations"] += 1
+
+def s3_state_io(bucket, key):
+    """(load, save) callables persisting state (SoC, tokens, cursors) as a JSON object in S3."""
+    def load():
+        s3 = get_aws_client("s3")
+        try:
+            return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        except s3.exceptions.NoSuchKey:
+            return None
+
+    def save(state):
+        get_aws_client("s3").put_object(Bucket=bucket, Key=key, Body=json.dumps(state).encode(),
+                                        ContentType="application/json")
+    return load, save
+
+####################
+# PUBLISH TO TIMESTREAM
+####################
+TIMESTREAM_MAX_RECORDS = 100  # write_records per-request limit
+TIMESTREAM_MAX_WORKERS = int(os.getenv("TIMESTREAM_MAX_WORKERS", 4))
+TIMESTREAM_MAX_RETRIES = int(os.getenv("TIMESTREAM_MAX_RETRIES", 2))
+# SINGLE: one DOUBLE record per measure; MULTI: one record per (uname, sub) with typed measure columns
+TIMESTREAM_RECORD_MODE = os.getenv("TIMESTREAM_RECORD_MODE", "SINGLE").upper()
+TIMESTREAM_MULTI_MEASURE_NAME = os.getenv("TIMESTREAM_MULTI_MEASURE_NAME", "renogy")
+DIMENSION_KEYS = ("device_id", "uname", "sub", "category", "name", "sku")
+REQUIRED_KEYS = DIMENSION_KEYS + ("measure", "value")
+OPTIONAL_DIMENSION_KEYS = ("site",)  # written only when records carry them (fleet mode)
+
+def _timestream_rows(group, mode):
+    """Return (source item, time, record payload) rows for one device's items."""
+    if mode != "MULTI":
+        return [(item, item.get("time"), {"MeasureName": item["measure"], "MeasureValue": str(item["value"])})
+                for item in group]
+    # Collapse each (sub, time) of a device into one multi-measure row
+    rows = {}
+    for item in group:
+        key = (item["sub"], item.get("time"))
+        if key not in rows:
+            rows[key] = (item, key[1], {"MeasureValues": []})
+        rows[key][2]["MeasureValues"].append({"Name": item["measure"], "Value": str(item["value"]), "Type": "DOUBLE"})
+    return list(rows.values())
+
+def build_timestream_batches(combined_data, current_time_ms, mode=None):
+    """
+    Group records by device and pack whole devices into chunks of at most 100 records.
+    Time and any dimension shared by every record in a chunk are hoisted into
+    CommonAttributes. Items may carry their own "time" (ms) for backfills.
+    Returns a list of (common_attributes, records).
+    """
+    mode = (mode or TIMESTREAM_RECORD_MODE).upper()
+    by_device = {}
+    for entry in combined_data:
+        for item in entry:
+            # Log invalid records
+            if not all(key in item for key in REQUIRED_KEYS):
+                logger.warning(f"Skipping record due to missing keys: {item}")
+                print(f"Skipping record due to missing keys: {item}")
+                continue  # Skip invalid records
+            by_device.setdefault(item["device_id"], []).append(item)
+
+    chunks = [[]]
+    for group in by_device.values():
+        rows = _timestream_rows(group, mode)
+        for start in range(0, len(rows), TIMESTREAM_MAX_RECORDS):
+            part = rows[start:start + TIMESTREAM_MAX_RECORDS]
+            if len(chunks[-1]) + len(part) > TIMESTREAM_MAX_RECORDS:
+                chunks.append([])
+            chunks[-1].extend(part)
+
+    batches = []
+    for chunk in chunks:
+        if not chunk:
+            continue
+        first = chunk[0][0]
+        dimension_keys = DIMENSION_KEYS + tuple(
+            key for key in OPTIONAL_DIMENSION_KEYS if any(key in item for item, _, _ in chunk))
+        shared = [key for key in dimension_keys
+                  if key in first and all(item.get(key) == first[key] for item, _, _ in chunk)]
+        per_record = [key for key in dimension_keys if key not in shared]
+        times = {str(row_time or current_time_ms) for _, row_time, _ in chunk}
+
+        common = {"TimeUnit": "MILLISECONDS"}  # Use milliseconds since epoch
+        if mode == "MULTI":
+            common.update({"MeasureName": TIMESTREAM_MULTI_MEASURE_NAME, "MeasureValueType": "MULTI"})
+        else:
+            common["MeasureValueType"] = "DOUBLE"
+        if len(times) == 1:
+            common["Time"] = times.pop()
+        if shared:
+            common["Dimensions"] = [{"Name": key, "Value": first[key]} for key in shared]
+
+        records = []
+        for item, row_time, payload in chunk:
+            record = dict(payload)
+            if "Time" not in common:
+                record["Time"] = str(row_time or current_time_ms)
+            if per_record:
+                record["Dimensions"] = [{"Name": key, "Value": item[key]} for key in per_record if key in item]
+            records.append(record)
+        batches.append((common, records))
+    return batches
+
+def _rejected_records(error):
+    """Pull RejectedRecords from a RejectedRecordsException response."""
+    response = getattr(error, "response", None) or {}
+    return response.get("RejectedRecords") or response.get("Error", {}).get("RejectedRecords") or []
+
+def write_timestream_batch(db, table, common, records):
+    """Write one chunk; only RejectedRecords entries are retried. Returns records written."""
+    pending = records
+    for attempt in range(TIMESTREAM_MAX_RETRIES + 1):
+        try:
+            get_aws_client("timestream-write").write_records(
+                DatabaseName=db,
+                TableName=table,
+                CommonAttributes=common,
+                Records=pending
+            )
+            return len(records)
+        except Exception as e:
+            if (getattr(e, "response", None) or {}).get("Error", {}).get("Code") != "RejectedRecordsException":
+                logger.error(f"Error writing records to Timestream: {e}")
+                return len(records) - len(pending)
+            rejected = _rejected_records(e)
+            logger.warning(f"Timestream rejected {len(rejected)}/{len(pending)} records (attempt {attempt + 1}): {rejected}")
+            pending = [pending[r["RecordIndex"]] for r in rejected if "RecordIndex" in r]
+            if not pending:
+                return len(records)
+            time.sleep(0.1 * (2 ** attempt))
+    logger.error(f"Dropping {len(pending)} records rejected after {TIMESTREAM_MAX_RETRIES} retries")
+    return len(records) - len(pending)
+
+def write_to_timestream(combined_data, db, table, mode=None):
+    """Write data to Timestream in parallel, API-sized chunks; returns records written."""
+    # Get current time in milliseconds since epoch
+    current_time_ms = int(datetime.now().replace(second=0, microsecond=0).timestamp() * 1000)
+    batches = build_timestream_batches(combined_data, current_time_ms, mode)
+    total = sum(len(records) for _, records in batches)
+
+    # Log and write records to Timestream
+    logger.info(f"Writing {total} records in {len(batches)} request(s) to Timestream for table: {table}")
+    if not batches:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, min(TIMESTREAM_MAX_WORKERS, len(batches)))) as executor:
+        written = sum(executor.map(lambda batch: write_timestream_batch(db, table, *batch), batches))
+    logger.info(f"Successfully wrote {written}/{total} records to Timestream")
+    return written
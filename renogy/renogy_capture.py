@@ -0,0 +1,107 @@
+####################
+# RAW RESPONSE CAPTURE
+# Optional: appends raw Renogy API responses as gzip'd JSON lines
+# {"ts", "device_id", "category", "name", "sku", "data"} to rotating files, so
+# production load can be replayed through the transforms and writers
+# (bench/replay_capture.py) or exported (export_history.py raw).
+#####################
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+
+class RawCapture:
+    """Size/age rotated gzip JSON-lines writer; each write() is sync-flushed so a crash loses nothing written."""
+
+    def __init__(self, directory, prefix="raw", max_bytes=16 * 1024 * 1024, max_files=20, max_age=None,
+                 on_rotate=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_age = max_age      # seconds before a file is rotated regardless of size (None = size only)
+        self.on_rotate = on_rotate  # called with the path of each closed file (e.g. upload to S3)
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._raw = None
+        self._gzip = None
+        self._path = None
+        self._opened_at = 0.0
+
+    def write(self, samples):
+        """Append raw samples (dicts); capture errors are printed, never raised to the collector."""
+        if not samples:
+            return
+        data = "".join(json.dumps(sample, separators=(",", ":")) + "\n" for sample in samples).encode()
+        with self._lock:
+            try:
+                if self._gzip is None:
+                    self._open()
+                self._gzip.write(data)
+                self._gzip.flush(zlib.Z_SYNC_FLUSH)
+                self.samples += len(samples)
+                if self._raw.tell() >= self.max_bytes or (
+                        self.max_age is not None and time.time() - self._opened_at >= self.max_age):
+                    self._rotate()
+            except OSError as e:
+                print(f"Error capturing {len(samples)} raw samples: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._gzip is not None:
+                self._rotate()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self._path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{os.getpid()}.jsonl.gz")
+        self._raw = open(self._path, "ab")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="ab")
+        self._opened_at = time.time()
+
+    def _rotate(self):
+        path = self._path
+        self._gzip.close()
+        self._raw.close()
+        self._gzip = self._raw = self._path = None
+        if self.on_rotate:
+            try:
+                self.on_rotate(path)
+            except Exception as e:
+                print(f"Error handing off capture file {path}: {e}")
+        # Keep only the newest max_files captures
+        files = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.jsonl.gz")), key=os.path.getmtime)
+        for old in files[:-self.max_files] if self.max_files else []:
+            os.remove(old)
+
+
+def capture_from_env(prefix, on_rotate=None):
+    """RawCapture from RAW_CAPTURE_* settings, or None when RAW_CAPTURE_DIR is unset (capture off)."""
+    directory = os.getenv("RAW_CAPTURE_DIR")
+    if not directory:
+        return None
+    max_age = os.getenv("RAW_CAPTURE_MAX_AGE")
+    return RawCapture(
+        directory, prefix=prefix,
+        max_bytes=int(float(os.getenv("RAW_CAPTURE_MAX_MB", 16)) * 1024 * 1024),
+        max_files=int(os.getenv("RAW_CAPTURE_MAX_FILES", 20)),
+        max_age=float(max_age) if max_age else None,
+        on_rotate=on_rotate,
+    )
+
+
+def read_capture(paths):
+    """Yield captured samples from capture files in order; a file still being written is read up to its last flush."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            try:
+                for line in f:
+                    if line.endswith("\n") and line.strip():
+                        yield json.loads(line)
+            except EOFError:
+                pass  # no gzip trailer yet (open or interrupted capture)
@@ -0,0 +1,116 @@
+####################
+# DEADBAND / ON-CHANGE FILTER
+# Sits between the transforms and the raw writers in both collectors. A field
+# is written when it moves past its deadband (absolute or percent of the last
+# written value) or when the heartbeat interval has passed since it was last
+# written. When a change follows suppressed samples, the last suppressed sample
+# is written first at its own time, so a line drawn through the written points
+# steps at the right moment instead of ramping across the quiet period.
+# Rollups, SoC, derived metrics and CloudWatch still see every sample.
+#####################
+import fnmatch
+import os
+
+
+def parse_rules(value):
+    """'Volts*:0.02,Watts*:2%,shnt-071/*:0' -> [(pattern, "abs" | "pct", threshold)], first match wins."""
+    rules = []
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        pattern, threshold = item.rsplit(":", 1)
+        threshold = threshold.strip()
+        if threshold.endswith("%"):
+            rules.append((pattern.strip(), "pct", float(threshold[:-1])))
+        else:
+            rules.append((pattern.strip(), "abs", float(threshold)))
+    return rules
+
+
+class DeadbandFilter:
+    """Per (device, field) deadband with a heartbeat; fields without a matching rule always pass."""
+
+    def __init__(self, rules, heartbeat=300.0):
+        self.rules = rules
+        self.heartbeat = heartbeat
+        self.stats = {"written": 0, "suppressed": 0, "heartbeats": 0, "step_points": 0}
+        self._series = {}      # (device, field) -> [written value, written ts, pending value, pending ts]
+        self._thresholds = {}  # (device, field) -> (kind, threshold) or None
+
+    def threshold(self, device, field):
+        key = (device, field)
+        if key not in self._thresholds:
+            # Patterns with a "/" match "<device>/<field>" (tuple devices are joined: "shnt-071/pri/volt")
+            name = "/".join((*device, field)) if isinstance(device, tuple) else f"{device}/{field}"
+            self._thresholds[key] = next(
+                ((kind, threshold) for pattern, kind, threshold in self.rules
+                 if fnmatch.fnmatchcase(name if "/" in pattern else field, pattern)), None)
+        return self._thresholds[key]
+
+    @staticmethod
+    def _moved(last, value, kind, threshold):
+        if kind == "pct":
+            return abs(value - last) > abs(last) * threshold / 100
+        return abs(value - last) > threshold
+
+    def filter(self, device, fields, ts):
+        """
+        Fields of one device sample at ts (seconds) that should be written. Returns
+        [(ts, fields)]: step-closing samples at their own (earlier) times first, then
+        this sample's fields; empty when everything was suppressed.
+        """
+        current = {}
+        closing = {}
+        for field, value in fields.items():
+            rule = self.threshold(device, field) if isinstance(value, (int, float)) else None
+            if rule is None:
+                current[field] = value
+                continue
+            key = (device, field)
+            state = self._series.get(key)
+            if state is None:
+                self._series[key] = [value, ts, None, None]
+                current[field] = value
+            elif self._moved(state[0], value, *rule):
+                if state[3] is not None:
+                    closing.setdefault(state[3], {})[field] = state[2]
+                    self.stats["step_points"] += 1
+                self._series[key] = [value, ts, None, None]
+                current[field] = value
+            elif ts - state[1] >= self.heartbeat:
+                self._series[key] = [value, ts, None, None]
+                current[field] = value
+                self.stats["heartbeats"] += 1
+            else:
+                state[2], state[3] = value, ts
+                self.stats["suppressed"] += 1
+        self.stats["written"] += len(current)
+        batches = sorted(closing.items())
+        if current:
+            batches.append((ts, current))
+        return batches
+
+
+def filter_entries(deadband_filter, entries, ts, split, build):
+    """
+    The deadband step of both collectors' write paths; entries pass through
+    unchanged when the filter is off (None). split(entry) -> {device: {field: value}},
+    build(entry, device, fields, step_ts) -> one entry to write (step_ts < ts for
+    step-closing samples). Returns the built entries in write order.
+    """
+    if deadband_filter is None:
+        return entries
+    filtered = []
+    for entry in entries:
+        for device, values in split(entry).items():
+            for step_ts, fields in deadband_filter.filter(device, values, ts):
+                filtered.append(build(entry, device, fields, step_ts))
+    return filtered
+
+
+def filter_from_env():
+    """DeadbandFilter from DEADBAND_RULES / DEADBAND_HEARTBEAT, or None when no rules are set (filter off)."""
+    rules = parse_rules(os.getenv("DEADBAND_RULES"))
+    if not rules:
+        return None
+    return DeadbandFilter(rules, heartbeat=float(os.getenv("DEADBAND_HEARTBEAT", 300)))
@@ -0,0 +1,133 @@
+####################
+# INCREMENTAL DERIVED-METRICS ENGINE
+# Derived series are declared as arithmetic formulas over input keys written as
+# {uname/sub/measure} (e.g. "{shnt-071/pri/amps} - {mppt-914/pri/amps}").
+# Formulas may reference other derived outputs; they are compiled once into a
+# topologically ordered DAG. update() re-evaluates only nodes whose inputs
+# changed and falls back to the last known input value while it is fresh.
+#####################
+import ast
+import re
+import time
+
+_REF = re.compile(r"\{([^{}]+)\}")
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd)
+_FUNCTIONS = {"min": min, "max": max, "abs": abs}
+
+
+def parse_key(ref):
+    """'shnt-071/pri/amps' -> ('shnt-071', 'pri', 'amps')."""
+    return tuple(part.strip() for part in ref.split("/"))
+
+
+def compile_formula(expr):
+    """Compile a formula once; returns (code, input keys in variable order)."""
+    keys = []
+
+    def substitute(match):
+        key = parse_key(match.group(1))
+        if key not in keys:
+            keys.append(key)
+        return f"_v{keys.index(key)}"
+
+    source = _REF.sub(substitute, expr)
+    tree = ast.parse(source, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in formula: {expr}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS):
+            raise ValueError(f"Unsupported function in formula: {expr}")
+        if isinstance(node, ast.Name) and node.id not in _FUNCTIONS and not node.id.startswith("_v"):
+            raise ValueError(f"Unknown name '{node.id}' in formula: {expr} (wrap inputs in {{uname/sub/measure}})")
+    return compile(tree, f"<formula {expr}>", "eval"), tuple(keys)
+
+
+class DerivedEngine:
+    """Compiled DAG of derived formulas with incremental re-evaluation."""
+
+    def __init__(self, formulas, precision=4, max_age=None):
+        """
+        formulas: {output key (uname, sub, measure): formula string}
+        max_age: seconds an input's last known value may be reused (None = forever)
+        """
+        self.precision = precision
+        self.max_age = max_age
+        compiled = {out: compile_formula(expr) for out, expr in formulas.items()}
+        self.nodes = self._toposort(compiled)  # [(output key, code, input keys)]
+        outputs = {out for out, _, _ in self.nodes}
+        self.inputs = {key for _, _, keys in self.nodes for key in keys if key not in outputs}
+        self.values = {}   # last known input and output values
+        self.updated = {}  # input key -> monotonic time of last update
+        self.evaluations = 0
+
+    @staticmethod
+    def _toposort(compiled):
+        ordered, state = [], {}
+
+        def visit(out, path):
+            if state.get(out) == "done":
+                return
+            if state.get(out) == "visiting":
+                raise ValueError(f"Cycle in derived formulas: {' -> '.join('/'.join(k) for k in path + [out])}")
+            state[out] = "visiting"
+            for key in compiled[out][1]:
+                if key in compiled:
+                    visit(key, path + [out])
+            state[out] = "done"
+            ordered.append((out, *compiled[out]))
+
+        for out in compiled:
+            visit(out, [])
+        return ordered
+
+    def update(self, values, now=None):
+        """
+        Feed new input values ({key: value}; unknown keys are ignored). Returns the
+        current value of every derived output that can be computed.
+        """
+        now = time.monotonic() if now is None else now
+        changed = set()
+        for key, value in values.items():
+            if key in self.inputs:
+                self.updated[key] = now
+                if self.values.get(key) != value:
+                    self.values[key] = value
+                    changed.add(key)
+
+        # Expire inputs that haven't been refreshed within max_age
+        if self.max_age is not None:
+            for key, updated in self.updated.items():
+                if now - updated > self.max_age and key in self.values:
+                    del self.values[key]
+                    changed.add(key)
+
+        for out, code, keys in self.nodes:
+            if not changed.intersection(keys) and (out in self.values or not all(k in self.values for k in keys)):
+                continue
+            if all(k in self.values for k in keys):
+                self.evaluations += 1
+                try:
+                    result = round(eval(code, {"__builtins__": {}, **_FUNCTIONS},
+                                        {f"_v{i}": self.values[k] for i, k in enumerate(keys)}), self.precision)
+                except ZeroDivisionError:
+                    result = None
+            else:
+                result = None
+            if result is None:
+                if self.values.pop(out, None) is not None:
+                    changed.add(out)
+            elif self.values.get(out) != result:
+                self.values[out] = result
+                changed.add(out)
+
+        return {out: self.values[out] for out, _, _ in self.nodes if out in self.values}
+
+    def update_from_store(self, store, now=None):
+        """Feed only the watched inputs from a MeasurementStore-like object (get(uname, sub, measure))."""
+        values = {}
+        for key in self.inputs:
+            item = store.get(*key)
+            if item is not None:
+                values[key] = item["value"]
+        return self.update(values, now)
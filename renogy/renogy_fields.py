@@ -0,0 +1,73 @@
+####################
+# DEVICE FIELD TABLES
+# The raw API field -> measurement tables of both collectors, compiled once at
+# import. Kept apart from the collectors so exports and benches can transform
+# captured samples without running either collector's setup.
+#####################
+from renogy_transform import compile_fields, compile_measures
+
+####################
+# PI COLLECTOR (renogyquery.py): one field table per configured device name
+####################
+SOLAR_CONTROLLER_FIELDS = {
+    "auxiliaryBatteryTemperature": ("BatteryTemp", float, 2, lambda v: (v * 1.8) + 32),  # Convert to Fahrenheit
+    "solarWatts": ("WattsSolar", float, 4),
+    "solarChargingVolts": ("VoltsSolar", float, 4),
+    "solarChargingAmps": ("AmpsSolar", float, 4),
+    "auxiliaryBatteryChargingVolts": ("VoltsMPPT", float, 2),
+    "gridChargeAmps": ("AmpsMPPT", float, 4, lambda v: v / 1000)  # Convert to Amps
+}
+
+MAIN_SHUNT_FIELDS = {
+    "batteryVolts": ("VoltsMain", float, 4),
+    "current": ("AmpsMain", float, 4)
+}
+
+INVERTER_SHUNT_FIELDS = {
+    "batteryVolts": ("VoltsInv", float, 4),
+    "current": ("AmpsInv", float, 4)
+}
+
+# Compiled once at import; keyed by the device names used in DEVICES
+DEVICE_PLANS = {
+    "Solar": compile_fields(SOLAR_CONTROLLER_FIELDS),
+    "Main": compile_fields(MAIN_SHUNT_FIELDS),
+    "Inverter": compile_fields(INVERTER_SHUNT_FIELDS),
+}
+
+# Renogy API category of each device, recorded with captured raw responses
+DEVICE_CATEGORIES = {"Solar": "Controller", "Main": "Battery Shunt", "Inverter": "Battery Shunt"}
+
+####################
+# LAMBDA COLLECTOR (v2-aws/renogy_ingest.py): measure tables per API category
+####################
+# Measure tables per category: {(sub, measure): (raw field(s), precision, fn)}
+CONTROLLER_MEASURES = {
+    # MPPT (primary: sub="pri")
+    ("pri", "amps"): ("gridChargeAmps", 4, lambda a: a / 1000),
+    ("pri", "volt"): ("auxiliaryBatteryChargingVolts", 4, None),
+    ("pri", "watt"): (("gridChargeAmps", "auxiliaryBatteryChargingVolts"), 4, lambda a, v: (a / 1000) * v),
+    # Solar (sub="sol")
+    ("sol", "watt"): ("solarWatts", 4, None),
+    ("sol", "volt"): ("solarChargingVolts", 4, None),
+    ("sol", "amps"): ("solarChargingAmps", 4, None),
+    # Load (sub="lod")
+    ("lod", "volt"): ("loadVolts", 4, None),
+    ("lod", "amps"): ("loadAmps", 4, None),
+    ("lod", "watt"): (("loadVolts", "loadAmps"), 4, lambda v, a: v * a),
+    # Temperature (single value, converted to Fahrenheit)
+    ("pri", "temp"): ("auxiliaryBatteryTemperature", 2, lambda t: (t * 1.8) + 32),
+}
+
+SHUNT_MEASURES = {
+    # Primary shunt values (sub="pri")
+    ("pri", "volt"): ("batteryVolts", 4, None),
+    ("pri", "amps"): ("current", 4, None),
+    ("pri", "watt"): (("batteryVolts", "current"), 4, lambda v, a: v * a),
+}
+
+# Compiled once at import: {category: (uname prefix, plan)}
+CATEGORY_PLANS = {
+    "Controller": ("mppt", compile_measures(CONTROLLER_MEASURES)),
+    "Battery Shunt": ("shnt", compile_measures(SHUNT_MEASURES)),
+}
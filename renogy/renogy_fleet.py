@@ -0,0 +1,136 @@
+####################
+# MULTI-SITE FLEET MODE
+# Shared by renogyquery.py and v2-aws/renogy_ingest.py. A JSON registry lists
+# sites (one rig / Renogy account each); sites are assigned to workers (Pi
+# processes or Lambda fan-out shards) on a consistent-hash ring, so changing the
+# worker count only moves the sites that land on the new slots. Each site keeps
+# its own keep-alive session, request governor (rate budget) and per-site state.
+#####################
+import bisect
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from renogy_governor import build_session, governor_from_env
+
+# Registry keys that override the RENOGY_* governor settings for one site
+GOVERNOR_OVERRIDES = {
+    "rate_limit": "rate",
+    "rate_burst": "burst",
+    "max_retries": "max_retries",
+    "breaker_threshold": "breaker_threshold",
+    "breaker_cooldown": "breaker_cooldown",
+}
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring of workers 0..workers-1 with virtual nodes for an even spread."""
+
+    def __init__(self, workers, replicas=64):
+        points = sorted((_hash(f"worker-{worker}#{replica}"), worker)
+                        for worker in range(workers) for replica in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._workers = [worker for _, worker in points]
+
+    def worker_for(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._workers[index]
+
+
+def parse_registry(text):
+    """Site configs from registry JSON ({"sites": [...]} or a bare list); every site needs a unique "site" name."""
+    registry = json.loads(text)
+    sites = registry.get("sites", []) if isinstance(registry, dict) else registry
+    names = set()
+    for config in sites:
+        name = config.get("site")
+        if not name:
+            raise ValueError(f"Fleet registry entry without a site name: {config}")
+        if name in names:
+            raise ValueError(f"Duplicate site in fleet registry: {name}")
+        names.add(name)
+    return sites
+
+
+def load_registry(path):
+    with open(path) as f:
+        return parse_registry(f.read())
+
+
+def assign_sites(sites, worker, workers, replicas=64):
+    """The site configs owned by worker (0-based) out of workers."""
+    if workers <= 1:
+        return list(sites)
+    ring = HashRing(workers, replicas)
+    return [config for config in sites if ring.worker_for(config["site"]) == worker]
+
+
+def suffixed_path(path, suffix):
+    """Per-site/per-worker variant of a state file path: soc_state.json -> soc_state.<suffix>.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+
+class Site:
+    """One registry entry with its own connection pool, request governor and lazily built state."""
+
+    def __init__(self, config, pool_size=4):
+        self.name = config["site"]
+        self.config = config
+        self.session = build_session(pool_size)
+        self.governor = governor_from_env(**{
+            kwarg: config[key] for key, kwarg in GOVERNOR_OVERRIDES.items() if key in config
+        })
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def state(self, key, factory):
+        """Per-site object (SoC estimator, rollups, derived engine, ...) built on first use."""
+        with self._lock:
+            if key not in self._state:
+                self._state[key] = factory()
+            return self._state[key]
+
+    def close(self):
+        self.session.close()
+
+
+class Fleet:
+    """Site objects for this worker, kept across cycles/warm invocations and rebuilt when their config changes."""
+
+    def __init__(self, pool_size=4):
+        self.pool_size = pool_size
+        self.sites = {}
+
+    def assign(self, configs, worker=0, workers=1):
+        """Sites owned by worker; sites that moved away or left the registry are closed."""
+        owned = {config["site"]: config for config in assign_sites(configs, worker, workers)}
+        for name in list(self.sites):
+            if name not in owned or self.sites[name].config != owned[name]:
+                self.sites.pop(name).close()
+        for name, config in owned.items():
+            if name not in self.sites:
+                self.sites[name] = Site(config, self.pool_size)
+        return list(self.sites.values())
+
+
+def run_sites(sites, fn, max_workers=8):
+    """Run fn(site) for every site concurrently; returns {site name: result}, None for a site that raised."""
+    def run(site):
+        # Isolate failures so one bad site doesn't sink the others
+        try:
+            return fn(site)
+        except Exception as e:
+            print(f"Error collecting site {site.name}: {e}")
+            return None
+
+    if not sites:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sites)))) as executor:
+        return dict(zip((site.name for site in sites), executor.map(run, sites)))
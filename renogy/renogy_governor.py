@@ -0,0 +1,198 @@
+####################
+# RENOGY API REQUEST GOVERNOR
+# Shared by renogyquery.py and v2-aws/renogy_ingest.py. Every API call goes
+# through a per-access-key token bucket, retries 429/5xx/connection errors with
+# exponential backoff + jitter (honouring Retry-After), and trips a per-key
+# circuit breaker after repeated failures. build_session() is the keep-alive
+# session every collector (and the Peplink client) sends those calls through.
+#####################
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens/sec, up to burst tokens."""
+
+    def __init__(self, rate, burst):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be > 0 requests/sec, got {rate}")
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds):
+        """
+        Push the bucket into debt after a 429 so every caller backs off together.
+        Concurrent 429s for the same window share one debt instead of stacking.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """Opens after threshold consecutive failures; allows one trial call after cooldown."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()  # half-open: one trial per cooldown
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+class RequestGovernor:
+    """Rate limit, retry and circuit-break signed Renogy API calls per access key."""
+
+    def __init__(self, rate=5.0, burst=10, max_retries=3, backoff_base=0.5, backoff_max=30.0,
+                 breaker_threshold=5, breaker_cooldown=60.0):
+        if rate <= 0:
+            raise ValueError(f"RENOGY_RATE_LIMIT must be > 0 requests/sec, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected_open": 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _state(self, access_key):
+        with self.lock:
+            if access_key not in self.buckets:
+                self.buckets[access_key] = TokenBucket(self.rate, self.burst)
+                self.breakers[access_key] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self.buckets[access_key], self.breakers[access_key]
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry attempt (0-based); Retry-After wins when given."""
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def call(self, access_key, send):
+        """
+        Run send() (which signs and performs one request, returning a Response) under
+        the governor. Returns the last Response, or None if the circuit is open or
+        every attempt raised.
+        """
+        bucket, breaker = self._state(access_key)
+        if not breaker.allow():
+            self._count("rejected_open")
+            return None
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            self._count("requests")
+            throttled = False
+            try:
+                response = send()
+            except Exception as e:
+                print(f"Renogy API request failed (attempt {attempt + 1}): {e}")
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    breaker.record(response.status_code < 500)
+                    return response
+                if response.status_code == 429:
+                    # The drained bucket is the only wait: the next acquire() blocks for
+                    # Retry-After, and so does every other caller on this key
+                    throttled = True
+                    self._count("throttled")
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                    if retry_after is None:
+                        retry_after = self.backoff_base * (2 ** attempt)
+                    bucket.drain(self.backoff(attempt, retry_after))
+
+            if attempt == self.max_retries:
+                break
+            self._count("retries")
+            if not throttled:
+                time.sleep(self.backoff(attempt))
+
+        self._count("failures")
+        breaker.record(False)
+        return response
+
+
+def _parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def build_session(pool_size):
+    """Keep-alive session whose connection pool matches the caller's worker count."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def governor_from_env(**overrides):
+    """Build a governor from RENOGY_* environment settings (keyword overrides win, e.g. per fleet site)."""
+    settings = dict(
+        rate=float(os.getenv("RENOGY_RATE_LIMIT", 5)),
+        burst=float(os.getenv("RENOGY_RATE_BURST", 10)),
+        max_retries=int(os.getenv("RENOGY_MAX_RETRIES", 3)),
+        backoff_base=float(os.getenv("RENOGY_BACKOFF_BASE", 0.5)),
+        backoff_max=float(os.getenv("RENOGY_BACKOFF_MAX", 30)),
+        breaker_threshold=int(os.getenv("RENOGY_BREAKER_THRESHOLD", 5)),
+        breaker_cooldown=float(os.getenv("RENOGY_BREAKER_COOLDOWN", 60)),
+    )
+    settings.update(overrides)
+    return RequestGovernor(**settings)
@@ -0,0 +1,194 @@
+####################
+# INFLUXDB BATCHING WRITER
+# Long-lived background writer: points are queued as line protocol, flushed on
+# size or time in one gzip'd write, and spooled to a bounded append-only file
+# when InfluxDB is unavailable (replayed after the next successful write).
+# Batches InfluxDB rejects outright (4xx other than 429) are counted and dropped,
+# not spooled: retrying malformed points would only wedge the spool.
+#####################
+import os
+import queue
+import threading
+import time
+
+from influxdb_client import WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+
+class InfluxWriter:
+    """Background line-protocol writer with an on-disk spool."""
+
+    def __init__(self, client, bucket, org=None, batch_size=500, flush_interval=10.0,
+                 spool_path=None, spool_max_bytes=50 * 1024 * 1024, precision=WritePrecision.S):
+        self.write_api = client.write_api(write_options=SYNCHRONOUS)
+        self.bucket = bucket
+        self.org = org
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self.precision = precision
+
+        # Counters for logging/metrics
+        self.written = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.rejected = 0  # points InfluxDB refused with a 4xx (never retried)
+        self.send_seconds = 0.0  # time spent in InfluxDB write calls
+
+        self._queue = queue.Queue(maxsize=batch_size * 20)
+        self._spool_lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, points):
+        """Queue points (Point objects or line protocol strings); never blocks on InfluxDB."""
+        for point in points:
+            line = point if isinstance(point, str) else point.to_line_protocol()
+            if not line:
+                continue
+            try:
+                self._queue.put_nowait(line)
+            except queue.Full:
+                self._spool([line])
+        if self._queue.qsize() >= self.batch_size:
+            self._flush_now.set()
+
+    def flush(self):
+        """Ask the background thread to flush now."""
+        self._flush_now.set()
+
+    def close(self, timeout=30):
+        """Flush remaining points (spooling on failure) and stop the background thread."""
+        self._stop.set()
+        self._flush_now.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            self._drain()
+        self._drain()
+
+    def _next_batch(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        """Send queued batches; once a send fails, spool everything left in the queue."""
+        healthy = True
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                break
+            if healthy and self._send(batch):
+                continue
+            healthy = False
+            self._spool(batch)
+        if healthy:
+            self._replay_spool()
+
+    def _send(self, lines):
+        """
+        Write one batch; returns False only when it should be retried later
+        (connection errors, 429 and 5xx). A 4xx rejection is counted and dropped.
+        """
+        started = time.perf_counter()
+        try:
+            self.write_api.write(bucket=self.bucket, org=self.org, record=lines, write_precision=self.precision)
+            self.written += len(lines)
+            return True
+        except Exception as e:
+            status = getattr(e, "status", None)  # influxdb_client ApiException
+            if isinstance(status, int) and 400 <= status < 500 and status != 429:
+                self.rejected += len(lines)
+                print(f"InfluxDB rejected {len(lines)} points (HTTP {status}); dropped: {e}")
+                return True
+            print(f"Error writing {len(lines)} points to InfluxDB: {e}")
+            return False
+        finally:
+            self.send_seconds += time.perf_counter() - started
+
+    def _spool(self, lines):
+        """Append lines to the spool file, dropping them if the spool is full or unset."""
+        if not self.spool_path:
+            self.dropped += len(lines)
+            return
+        data = "".join(f"{line}\n" for line in lines)
+        with self._spool_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+                size = self._spool_size()
+                if size + len(data) > self.spool_max_bytes:
+                    self.dropped += len(lines)
+                    print(f"InfluxDB spool full ({size} bytes); dropped {len(lines)} points")
+                    return
+                with open(self.spool_path, "a") as f:
+                    f.write(data)
+                self.spooled += len(lines)
+            except OSError as e:
+                self.dropped += len(lines)
+                print(f"Error spooling {len(lines)} points to {self.spool_path}: {e}")
+
+    def _replay_spool(self):
+        """
+        Replay spooled points in batches; on failure keep the unsent remainder.
+        The spool is renamed aside under the lock and sent without it, so write()
+        can keep spooling (queue full) while a long replay is on the wire.
+        """
+        if not self.spool_path:
+            return
+        replay_path = f"{self.spool_path}.replaying"
+        with self._spool_lock:
+            # A leftover snapshot (crash mid-replay) is older than the spool: send it first
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path) or os.path.getsize(self.spool_path) == 0:
+                    return
+                os.replace(self.spool_path, replay_path)
+        written, rejected = self.written, self.rejected
+        with open(replay_path) as f:
+            batch = []
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    batch.append(line)
+                if len(batch) >= self.batch_size:
+                    if not self._send(batch):
+                        self._keep_remainder(batch, f, replay_path)
+                        return
+                    batch = []
+            if batch and not self._send(batch):
+                self._keep_remainder(batch, f, replay_path)
+                return
+        os.remove(replay_path)
+        rejected = self.rejected - rejected
+        print(f"Replayed {self.written - written} spooled points to InfluxDB"
+              + (f" ({rejected} rejected)" if rejected else ""))
+
+    def _keep_remainder(self, batch, f, replay_path):
+        """Put the unsent remainder back in front of whatever was spooled during the replay."""
+        tmp_path = f"{self.spool_path}.tmp"
+        with self._spool_lock:
+            with open(tmp_path, "w") as tmp:
+                tmp.writelines(f"{line}\n" for line in batch)
+                for line in f:
+                    tmp.write(line)
+                if os.path.exists(self.spool_path):
+                    with open(self.spool_path) as spooled:
+                        for line in spooled:
+                            tmp.write(line)
+            os.replace(tmp_path, self.spool_path)
+            os.remove(replay_path)
+
+    def _spool_size(self):
+        """Bytes on disk across the spool and any snapshot being replayed."""
+        return sum(os.path.getsize(path) for path in (self.spool_path, f"{self.spool_path}.replaying")
+                   if os.path.exists(path))
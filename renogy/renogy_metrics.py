@@ -0,0 +1,155 @@
+####################
+# LIGHTWEIGHT METRICS (PROMETHEUS/OPENMETRICS TEXT)
+# Counters, gauges and histograms kept in plain dicts, timing spans as a
+# context manager, and a stdlib HTTP server exposing /metrics. Values owned by
+# other components (governor.stats, InfluxWriter counters) are read at scrape
+# time through collector callbacks instead of being copied on every update.
+#####################
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Span:
+    """Times a block and observes it into a histogram; elapsed (seconds) is readable afterwards."""
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._started
+        self.registry.observe(self.name, self.elapsed, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """In-process metric store rendered in the Prometheus text exposition format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._kinds = {}       # name -> "counter" | "gauge" | "histogram"
+        self._help = {}
+        self._values = {}      # (name, labels) -> value (counters/gauges)
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._kinds.setdefault(name, "counter")
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._kinds.setdefault(name, "gauge")
+            self._values[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._kinds.setdefault(name, "histogram")
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def span(self, name, **labels):
+        """with registry.span("renogy_transform_seconds", device="Main") as span: ..."""
+        return Span(self, name, labels)
+
+    def add_collector(self, collect):
+        """collect() -> iterable of (name, kind, labels, value), evaluated on every render()."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus/OpenMetrics text format."""
+        with self._lock:
+            samples = [(name, self._kinds[name], dict(labels), value) for (name, labels), value in self._values.items()]
+            histograms = [(name, dict(labels), list(hist)) for (name, labels), hist in self._histograms.items()]
+        for collect in self._collectors:
+            try:
+                samples.extend(collect())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for name, kind, labels, value in sorted(samples, key=lambda s: s[0]):
+            header(name, kind)
+            suffix = "_total" if kind == "counter" and not name.endswith("_total") else ""
+            lines.append(f"{name}{suffix}{_labels(labels)} {_number(value)}")
+        for name, labels, hist in sorted(histograms, key=lambda h: h[0]):
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, hist):
+                lines.append(f"{name}_bucket{_labels(dict(labels, le=_number(bound)))} {count}")
+            lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {hist[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(hist[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def start_metrics_server(registry, port, host="127.0.0.1"):
+    """Serve registry.render() on http://host:port/metrics from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,127 @@
+####################
+# STREAMING ROLLUP ENGINE
+# Keeps min/max/mean/last and energy integrals (Wh for watts, Ah for amps) per
+# (device, measure) over fixed windows (default 1 min, 15 min, 1 h). Closed
+# windows are returned as rollup dicts for the collector to write as separate
+# measurements (InfluxDB) or tables (Timestream).
+#####################
+
+DEFAULT_WINDOWS = (60, 900, 3600)
+
+
+def window_label(seconds):
+    """60 -> '1m', 900 -> '15m', 3600 -> '1h'."""
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+def parse_windows(value):
+    """Parse a comma separated list of window sizes in seconds ('60,900,3600')."""
+    return tuple(int(w) for w in value.split(",") if w.strip()) if value else ()
+
+
+def windows_for_poll(poll_interval, windows=DEFAULT_WINDOWS):
+    """The windows no shorter than the poll interval (shorter ones would mostly just hold the previous sample)."""
+    return tuple(w for w in windows if w >= poll_interval)
+
+
+def default_integral_unit(measure):
+    """Wh for watt fields ('watt', 'WattsSolar'), Ah for amp fields ('amps', 'AmpsMain'), else None."""
+    name = measure.lower()
+    if name.startswith("watt"):
+        return "Wh"
+    if name.startswith("amp"):
+        return "Ah"
+    return None
+
+
+class RollupEngine:
+    """Incremental windowed aggregates; values are held (step) between samples for integrals."""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, max_gap=600, integral_unit=default_integral_unit):
+        self.windows = tuple(sorted(windows))
+        self.max_gap = max_gap  # don't integrate across collector outages longer than this (seconds)
+        self.integral_unit = integral_unit
+        self._last = {}   # {(device, measure): (ts, value)}
+        self._open = {}   # {(window, device, measure): accumulator}
+        self._units = {}  # measure -> integral unit cache
+
+    def _unit(self, measure):
+        if measure not in self._units:
+            self._units[measure] = self.integral_unit(measure)
+        return self._units[measure]
+
+    def add(self, device, measure, value, ts):
+        """Add one sample (ts in seconds); returns rollups for any windows it closed."""
+        closed = []
+        series = (device, measure)
+        prev = self._last.get(series)
+        if prev and ts <= prev[0]:
+            return closed  # out-of-order or duplicate sample
+        bridged = prev is not None and ts - prev[0] <= self.max_gap
+        unit = self._unit(measure)
+
+        for window in self.windows:
+            key = (window, device, measure)
+            acc = self._open.get(key)
+            if acc is not None and ts >= acc["end"]:
+                if bridged and unit:
+                    acc["integral"] += prev[1] * (acc["end"] - max(prev[0], acc["start"]))
+                closed.append(self._close(window, device, measure, acc, unit))
+                if bridged:
+                    # Windows the gap skipped entirely held prev's value from start to end
+                    start = acc["end"]
+                    while start + window <= ts:
+                        held = {"start": start, "end": start + window, "min": prev[1], "max": prev[1],
+                                "sum": 0.0, "count": 0, "last": prev[1],
+                                "integral": prev[1] * window if unit else 0.0}
+                        closed.append(self._close(window, device, measure, held, unit))
+                        start += window
+                acc = None
+            if acc is None:
+                start = ts - (ts % window)
+                acc = self._open[key] = {"start": start, "end": start + window, "min": value, "max": value,
+                                         "sum": 0.0, "count": 0, "last": value, "integral": 0.0}
+                if bridged and unit:
+                    acc["integral"] += prev[1] * (ts - max(prev[0], start))
+            elif bridged and unit:
+                acc["integral"] += prev[1] * (ts - prev[0])
+
+            acc["min"] = min(acc["min"], value)
+            acc["max"] = max(acc["max"], value)
+            acc["sum"] += value
+            acc["count"] += 1
+            acc["last"] = value
+
+        self._last[series] = (ts, value)
+        return closed
+
+    def add_fields(self, device, fields, ts):
+        """Add every numeric field of one device sample; returns closed rollups."""
+        closed = []
+        for measure, value in fields.items():
+            if isinstance(value, (int, float)):
+                closed.extend(self.add(device, measure, float(value), ts))
+        return closed
+
+    def flush(self):
+        """Close and return every open window (e.g. for backfills); integrals stop at the last sample."""
+        closed = [self._close(window, device, measure, acc, self._unit(measure))
+                  for (window, device, measure), acc in self._open.items()]
+        self._open.clear()
+        return closed
+
+    @staticmethod
+    def _close(window, device, measure, acc, unit):
+        rollup = {
+            "window": window, "label": window_label(window), "start": acc["start"],
+            "device": device, "measure": measure,
+            "min": acc["min"], "max": acc["max"], "mean": acc["sum"] / acc["count"] if acc["count"] else acc["last"],
+            "last": acc["last"], "count": acc["count"],
+        }
+        if unit:
+            rollup[unit] = acc["integral"] / 3600.0  # W*s -> Wh, A*s -> Ah
+        return rollup
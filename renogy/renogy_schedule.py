@@ -0,0 +1,42 @@
+####################
+# GRID SCHEDULER
+# Due times used by renogyquery.py (one key per device) and peplinkquery.py
+# (one key for the whole InControl poll). Each key sits on a fixed grid
+# (start + n * interval) against a monotonic clock, so API and write latency
+# never accumulate as drift; ticks missed by an overrun are skipped rather
+# than run back-to-back.
+#####################
+import random
+import time
+
+
+class GridSchedule:
+    """Per-key due times on a fixed monotonic grid with optional wake-up jitter."""
+
+    def __init__(self, intervals, jitter=0.0, start=None):
+        self.intervals = intervals
+        self.jitter = jitter
+        start = time.monotonic() if start is None else start
+        self.next_due = {key: start for key in intervals}
+
+    def wait(self):
+        """Sleep until the earliest key is due; returns {key: lag seconds} for every key now due."""
+        delay = min(self.next_due.values()) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay + random.uniform(0, self.jitter))
+        now = time.monotonic()
+        return {key: now - due_at for key, due_at in self.next_due.items() if due_at <= now}
+
+    def advance(self, keys):
+        """Move each polled key to its next future grid slot; returns {key: ticks skipped}."""
+        finished = time.monotonic()
+        skipped = {}
+        for key in keys:
+            interval = self.intervals[key]
+            self.next_due[key] += interval
+            missed = 0
+            if self.next_due[key] <= finished:
+                missed = int((finished - self.next_due[key]) // interval) + 1
+                self.next_due[key] += missed * interval
+            skipped[key] = missed
+        return skipped
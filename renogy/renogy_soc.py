@@ -0,0 +1,124 @@
+####################
+# STATE OF CHARGE (COULOMB COUNTING) AND DAILY ENERGY
+# Integrates the main shunt current at each sample (value held between
+# samples), applies charge/discharge efficiency, resyncs to 100% after the
+# bank sits at absorption voltage with a small tail current, and tracks daily
+# Wh in/out. State is persisted through pluggable load/save callables so it
+# survives restarts (renogy_state.file_state_io on the Pi, S3 for the Lambda).
+#####################
+import os
+import time
+
+
+class SocEstimator:
+    """Coulomb-counting state of charge with full-charge resync and daily Wh totals."""
+
+    def __init__(self, capacity_ah=800.0, charge_efficiency=0.99, discharge_efficiency=1.0,
+                 full_voltage=14.0, tail_current=8.0, full_hold=300, max_gap=900, initial_soc=100.0,
+                 load_state=None, save_state=None, persist_interval=60):
+        self.capacity_ah = capacity_ah
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.full_voltage = full_voltage
+        self.tail_current = tail_current
+        self.full_hold = full_hold
+        self.max_gap = max_gap
+        self.save_state = save_state
+        self.persist_interval = persist_interval
+        self._persisted_at = 0.0
+
+        self.state = (load_state() if load_state else None) or {
+            "ah": capacity_ah * initial_soc / 100.0, "ts": None, "current": None, "volts": None,
+            "day": None, "wh_in": 0.0, "wh_out": 0.0, "full_since": None,
+        }
+
+    def update(self, current, volts, ts=None):
+        """Add a main shunt sample (A, positive = charging; V; ts in seconds); returns the published fields."""
+        ts = time.time() if ts is None else ts
+        state = self.state
+
+        day = time.strftime("%Y-%m-%d", time.localtime(ts))
+        watts = hours = 0.0
+        if state["ts"] is not None and 0 < ts - state["ts"] <= self.max_gap:
+            hours = (ts - state["ts"]) / 3600.0
+            prev_current = state["current"]
+            if prev_current >= 0:
+                state["ah"] += prev_current * hours * self.charge_efficiency
+            else:
+                state["ah"] += prev_current * hours / self.discharge_efficiency
+            state["ah"] = min(max(state["ah"], 0.0), self.capacity_ah)
+
+            watts = prev_current * state["volts"]
+            if state["day"] != day:
+                # The part of the interval before midnight belongs to the day that is ending
+                before = min(hours, max(0.0, (_local_midnight(ts) - state["ts"]) / 3600.0))
+                self._add_wh(watts, before)
+                hours -= before
+
+        if state["day"] != day:
+            state.update({"day": day, "wh_in": 0.0, "wh_out": 0.0})
+        self._add_wh(watts, hours)
+
+        # Full-charge resync: absorption voltage with tail current held for full_hold seconds
+        if volts >= self.full_voltage and 0 <= current <= self.tail_current:
+            if state["full_since"] is None:
+                state["full_since"] = ts
+            elif ts - state["full_since"] >= self.full_hold:
+                state["ah"] = self.capacity_ah
+        else:
+            state["full_since"] = None
+
+        if state["ts"] is None or ts > state["ts"]:
+            state.update({"ts": ts, "current": current, "volts": volts})
+        self._persist(ts)
+        return self.fields()
+
+    def _add_wh(self, watts, hours):
+        if watts >= 0:
+            self.state["wh_in"] += watts * hours
+        else:
+            self.state["wh_out"] -= watts * hours
+
+    def fields(self):
+        state = self.state
+        return {
+            "SoC": round(state["ah"] / self.capacity_ah * 100.0, 2),
+            "AhRemaining": round(state["ah"], 2),
+            "WhInToday": round(state["wh_in"], 2),
+            "WhOutToday": round(state["wh_out"], 2),
+        }
+
+    def _persist(self, ts, force=False):
+        if self.save_state and (force or ts - self._persisted_at >= self.persist_interval):
+            try:
+                self.save_state(self.state)
+                self._persisted_at = ts
+            except Exception as e:
+                print(f"Error persisting SoC state: {e}")
+
+    def persist(self):
+        """Force a state save (e.g. at shutdown or the end of a Lambda invocation)."""
+        self._persist(self.state["ts"] or time.time(), force=True)
+
+
+def _local_midnight(ts):
+    """Epoch seconds of local midnight at the start of ts's day (DST-aware)."""
+    t = time.localtime(ts)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+
+
+def estimator_from_env(load_state=None, save_state=None):
+    """Build an estimator from SOC_* environment settings."""
+    return SocEstimator(
+        capacity_ah=float(os.getenv("SOC_CAPACITY_AH", 800)),
+        charge_efficiency=float(os.getenv("SOC_CHARGE_EFFICIENCY", 0.99)),
+        discharge_efficiency=float(os.getenv("SOC_DISCHARGE_EFFICIENCY", 1.0)),
+        full_voltage=float(os.getenv("SOC_FULL_VOLTAGE", 14.0)),
+        tail_current=float(os.getenv("SOC_TAIL_CURRENT", 8.0)),
+        full_hold=float(os.getenv("SOC_FULL_HOLD", 300)),
+        max_gap=float(os.getenv("SOC_MAX_GAP", 900)),
+        initial_soc=float(os.getenv("SOC_INITIAL", 100)),
+        load_state=load_state,
+        save_state=save_state,
+        persist_interval=float(os.getenv("SOC_PERSIST_INTERVAL", 60)),
+    )
@@ -0,0 +1,26 @@
+####################
+# JSON STATE FILES
+# (load, save) callable pairs used by anything that keeps state across restarts
+# (SoC estimator, InControl token and cursors). The S3 equivalent for the
+# Lambdas is renogy_aws.s3_state_io.
+#####################
+import json
+import os
+
+
+def file_state_io(path):
+    """(load, save) callables persisting state (SoC, tokens, cursors) to a JSON file (atomic replace)."""
+    def load():
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(state):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    return load, save
@@ -0,0 +1,163 @@
+####################
+# SHARED TRANSFORM ENGINE
+# Used by renogyquery.py (Raspberry Pi) and v2-aws/renogy_ingest.py (Lambda).
+# Field tables are compiled once at import time into flat plans of
+# (output key, source fields, converter, precision) steps.
+#####################
+
+_MISSING = object()
+
+
+def _compose(dtype, transforms):
+    """
+    Fold the transform chain and final dtype cast into a single callable.
+
+    The callable carries the chain without the scalar cast as .array_fn so
+    run_plan_columns can apply it to whole NumPy columns.
+    """
+    if not transforms:
+        return dtype
+
+    def convert_array(v):
+        for transform in transforms:
+            v = transform(v)
+        return v
+
+    if len(transforms) == 1:
+        transform = transforms[0]
+        convert = lambda v: dtype(transform(v))
+    else:
+        def convert(v):
+            return dtype(convert_array(v))
+    convert.array_fn = convert_array
+    return convert
+
+
+def compile_fields(field_mapping):
+    """
+    Compile a raw-field keyed table into a plan.
+
+    field_mapping: {raw_field: (new_field, dtype, precision, *transforms)}
+    (the SOLAR_CONTROLLER_FIELDS layout used by renogyquery.py).
+    """
+    return tuple(
+        (new_field, (raw_field,), _compose(dtype, transforms), precision)
+        for raw_field, (new_field, dtype, precision, *transforms) in field_mapping.items()
+    )
+
+
+def compile_measures(measure_mapping):
+    """
+    Compile an output keyed table into a plan.
+
+    measure_mapping: {out_key: (sources, precision, fn)} where sources is a raw field
+    name or tuple of names passed positionally to fn (fn may be None for a single field).
+    Used for derived values such as watts = volts * amps.
+    """
+    plan = []
+    for out_key, (sources, precision, fn) in measure_mapping.items():
+        if isinstance(sources, str):
+            sources = (sources,)
+        if fn is None:
+            fn = float
+        plan.append((out_key, tuple(sources), fn, precision))
+    return tuple(plan)
+
+
+def run_plan(plan, raw_data, default=_MISSING):
+    """
+    Apply a compiled plan to one raw sample; returns {out_key: value}.
+
+    Missing source fields are skipped unless a default is given, in which case the
+    default is substituted (the Lambda behaviour of device_data.get(field, 0.0)).
+    """
+    transformed = {}
+    for out_key, sources, fn, precision in plan:
+        try:
+            if len(sources) == 1:
+                source = raw_data.get(sources[0], default)
+                if source is _MISSING:
+                    continue
+                value = fn(source)
+            else:
+                args = [raw_data.get(s, default) for s in sources]
+                if _MISSING in args:
+                    continue
+                value = fn(*args)
+            transformed[out_key] = round(value, precision)
+        except (TypeError, ValueError):
+            print(f"Error converting field {out_key} from {sources}")
+    return transformed
+
+
+def run_plan_batch(plan, samples, default=_MISSING):
+    """
+    Apply a compiled plan to many raw samples at once (backfills, large fleets).
+
+    Returns columns {out_key: [value or None per sample]} so no per-sample output
+    dicts are built.
+    """
+    columns = {}
+    for out_key, sources, fn, precision in plan:
+        column = []
+        append = column.append
+        single = sources[0] if len(sources) == 1 else None
+        for raw_data in samples:
+            try:
+                if single is not None:
+                    source = raw_data.get(single, default)
+                    append(None if source is _MISSING else round(fn(source), precision))
+                else:
+                    args = [raw_data.get(s, default) for s in sources]
+                    append(None if _MISSING in args else round(fn(*args), precision))
+            except (TypeError, ValueError):
+                append(None)
+        columns[out_key] = column
+    return columns
+
+
+def run_plan_columns(plan, columns):
+    """
+    Apply a compiled plan column-wise with NumPy (historical backfills/exports).
+
+    columns: {raw_field: float array} of equal length, NaN where a sample lacks the
+    field. Returns {out_key: float array}; steps whose source columns are absent are
+    skipped. Converters that can't take arrays fall back to element-wise evaluation.
+    """
+    import numpy as np
+
+    results = {}
+    for out_key, sources, fn, precision in plan:
+        if any(source not in columns for source in sources):
+            continue
+        args = [np.asarray(columns[source], dtype=float) for source in sources]
+        array_fn = getattr(fn, "array_fn", fn)
+        try:
+            if isinstance(array_fn, type):  # plain dtype cast (float/int)
+                values = args[0].copy()
+            else:
+                values = np.asarray(array_fn(*args), dtype=float)
+            if values.shape != args[0].shape:
+                raise TypeError("converter did not return a column")
+        except (TypeError, ValueError):
+            values = np.fromiter((_element(fn, row) for row in zip(*args)), dtype=float, count=len(args[0]))
+        results[out_key] = _round_column(np, values, precision)
+    return results
+
+
+def _round_column(np, values, precision):
+    """np.round, with near-half cases re-rounded by round() so results match run_plan exactly."""
+    scale = 10.0 ** precision
+    scaled = values * scale
+    rounded = np.round(scaled) / scale
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(v, precision) for v in values[near_half].tolist()]
+    return rounded
+
+
+def _element(fn, args):
+    try:
+        return fn(*args)
+    except (TypeError, ValueError):
+        return float("nan")
@@ -5,8 +5,28 @@ import hmac
 import base64
 from urllib.parse import urlencode
 import os
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+import sys
+import atexit
+import json
+import subprocess
+import threading
+from influxdb_client import InfluxDBClient, Point, WritePrecision
 from dotenv import load_dotenv
+from renogy_transform import compile_fields, run_plan
+# Field tables shared with export_history.py; compiled DEVICE_PLANS are keyed by the device names used in DEVICES
+from renogy_fields import (
+    DEVICE_CATEGORIES, DEVICE_PLANS, INVERTER_SHUNT_FIELDS, MAIN_SHUNT_FIELDS, SOLAR_CONTROLLER_FIELDS,
+)
+from renogy_influx import InfluxWriter
+from renogy_governor import governor_from_env
+from renogy_rollup import RollupEngine, parse_windows, windows_for_poll
+from renogy_soc import estimator_from_env
+from renogy_state import file_state_io
+from renogy_capture import capture_from_env
+from renogy_metrics import MetricsRegistry, start_metrics_server
+from renogy_fleet import Fleet, load_registry, suffixed_path
+from renogy_deadband import filter_entries, filter_from_env
+from renogy_schedule import GridSchedule
 
 # Load environment variables
 env_path = "/usr/local/etc/renogy/renogy.env"
@@ -14,52 +34,115 @@ load_dotenv(env_path)
 
 # TIMING
 collect_interval = int(os.getenv("COLLECTION_INTERVAL", 300))  # Default to 5 minutes
+schedule_jitter = float(os.getenv("SCHEDULE_JITTER", 0))  # Max random delay (seconds) added to each wake-up
+
+# Fleet mode: sites from FLEET_REGISTRY spread over FLEET_WORKERS processes by consistent hashing
+fleet_registry = os.getenv("FLEET_REGISTRY")
+fleet_workers = int(os.getenv("FLEET_WORKERS", 1))
+fleet_worker = os.getenv("FLEET_WORKER")  # set by the supervisor for each worker process
 
 # API Credentials
 host = os.getenv("RENOGY_HOST")
 sk = os.getenv("SECRET_KEY")
 ak = os.getenv("ACCESS_KEY")
+request_timeout = float(os.getenv("RENOGY_REQUEST_TIMEOUT", 10))
+
+# Keep-alive session; every API call goes through the rate-limit/retry/circuit-breaker governor
+http_session = requests.Session()
+governor = governor_from_env()
 
 # InfluxDB setup
 influx_url = os.getenv("INFLUX_URL")
 influx_token = os.getenv("INFLUX_TOKEN")
 influx_org = os.getenv("INFLUX_ORG")
 influx_bucket = os.getenv("INFLUX_BUCKET")
+influx_batch_size = int(os.getenv("INFLUX_BATCH_SIZE", 500))
+influx_flush_interval = float(os.getenv("INFLUX_FLUSH_INTERVAL", 10))
+influx_spool_path = os.getenv("INFLUX_SPOOL_PATH", "/var/lib/renogy/influx_spool.lp")
+influx_spool_max_mb = float(os.getenv("INFLUX_SPOOL_MAX_MB", 50))
+if fleet_worker and influx_spool_path:
+    influx_spool_path = suffixed_path(influx_spool_path, f"w{fleet_worker}")  # one spool per worker process
+
+client = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org, enable_gzip=True)
+influx_writer = InfluxWriter(
+    client, influx_bucket, org=influx_org,
+    batch_size=influx_batch_size,
+    flush_interval=influx_flush_interval,
+    spool_path=influx_spool_path,
+    spool_max_bytes=int(influx_spool_max_mb * 1024 * 1024),
+)
+atexit.register(influx_writer.close)
+
+# Rollups (min/max/mean/last/Wh/Ah) written as PowerMonitoring_1m, _15m, _1h; empty ROLLUP_WINDOWS disables.
+# Unset, the windows shorter than the fastest device poll interval are left out (built on first use)
+rollup_windows_raw = os.getenv("ROLLUP_WINDOWS")
+rollup_max_gap = float(os.getenv("ROLLUP_MAX_GAP", 600))
+rollup_state = {}
 
-client = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org)
+# Deadband/on-change filter for raw PowerMonitoring writes (DEADBAND_RULES unset = write every field)
+deadband = filter_from_env()
 
-# Define fields to process for each device
-SOLAR_CONTROLLER_FIELDS = {
-    "auxiliaryBatteryTemperature": ("BatteryTemp", float, 2, lambda v: (v * 1.8) + 32),  # Convert to Fahrenheit
-    "solarWatts": ("WattsSolar", float, 4),
-    "solarChargingVolts": ("VoltsSolar", float, 4),
-    "solarChargingAmps": ("AmpsSolar", float, 4),
-    "auxiliaryBatteryChargingVolts": ("VoltsMPPT", float, 2),
-    "gridChargeAmps": ("AmpsMPPT", float, 4, lambda v: v / 1000)  # Convert to Amps
-}
+# Coulomb-counting SoC from the Main shunt, written as device "Battery" (SoC, AhRemaining, WhInToday, WhOutToday)
+soc_state_path = os.getenv("SOC_STATE_PATH", "/var/lib/renogy/soc_state.json")
+soc_estimator = estimator_from_env(*file_state_io(soc_state_path))
+atexit.register(soc_estimator.persist)
 
-MAIN_SHUNT_FIELDS = {
-    "batteryVolts": ("VoltsMain", float, 4),
-    "current": ("AmpsMain", float, 4)
-}
+# Hot-path metrics served on http://METRICS_HOST:METRICS_PORT/metrics (METRICS_PORT=0 disables)
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.getenv("METRICS_PORT", 9108))
+if fleet_worker and metrics_port:
+    metrics_port += int(fleet_worker)  # worker i serves METRICS_PORT + i
+metrics_log_cycles = os.getenv("METRICS_LOG_CYCLES", "").lower() in ("1", "true", "yes")  # one JSON line per cycle
+metrics = MetricsRegistry()
+metrics.describe("renogy_sign_seconds", "Time to sign one Renogy API request")
+metrics.describe("renogy_http_request_seconds", "Latency of each Renogy API HTTP attempt")
+metrics.describe("renogy_device_fetch_seconds", "get_device_data latency per device, including retries and backoff")
+metrics.describe("renogy_transform_seconds", "transform_data time per device")
+metrics.describe("renogy_influx_queue_seconds", "write_combined_to_influx time (building and queueing points)")
+metrics.describe("renogy_cycle_seconds", "Full monitor_devices cycle time")
+metrics.describe("renogy_errors", "Collector errors by kind")
+metrics.add_collector(lambda: [
+    *((f"renogy_api_{key}", "counter", {}, value) for key, value in governor.stats.items()),
+    ("renogy_influx_points_written", "counter", {}, influx_writer.written),
+    ("renogy_influx_points_spooled", "counter", {}, influx_writer.spooled),
+    ("renogy_influx_points_dropped", "counter", {}, influx_writer.dropped),
+    ("renogy_influx_points_rejected", "counter", {}, influx_writer.rejected),
+    ("renogy_influx_send_seconds", "counter", {}, round(influx_writer.send_seconds, 6)),
+    *((f"renogy_deadband_{key}", "counter", {}, value) for key, value in (deadband.stats if deadband else {}).items()),
+])
 
-INVERTER_SHUNT_FIELDS = {
-    "batteryVolts": ("VoltsInv", float, 4),
-    "current": ("AmpsInv", float, 4)
-}
+# Optional raw API response capture for replay/backfill (off unless RAW_CAPTURE_DIR is set)
+raw_capture = capture_from_env("pi")
+if raw_capture:
+    atexit.register(raw_capture.close)
 
 # Parse devices from .env
-def load_devices():
-    """Load devices from the environment file."""
-    devices_raw = os.getenv("DEVICES")
+def load_devices(devices_raw=None):
+    """Load devices from the environment file (or a fleet site's "devices" string/dict)."""
+    devices_raw = devices_raw or os.getenv("DEVICES")
     if not devices_raw:
         raise ValueError("No devices configured in the .env file")
+    if isinstance(devices_raw, dict):
+        return dict(devices_raw)
     devices = {}
     for pair in devices_raw.split(","):
         name, device_id = pair.split(":")
         devices[name.strip()] = device_id.strip()
     return devices
 
+def load_intervals(devices, intervals_raw=None):
+    """Per-device poll intervals from DEVICE_INTERVALS (name:seconds,...), defaulting to COLLECTION_INTERVAL."""
+    intervals = {name: float(collect_interval) for name in devices}
+    intervals_raw = intervals_raw or os.getenv("DEVICE_INTERVALS")
+    if isinstance(intervals_raw, dict):
+        intervals_raw = ",".join(f"{name}:{seconds}" for name, seconds in intervals_raw.items())
+    if intervals_raw:
+        for pair in intervals_raw.split(","):
+            name, seconds = pair.split(":")
+            if name.strip() in intervals:
+                intervals[name.strip()] = float(seconds)
+    return intervals
+
 # Helper Functions
 def get_param_str(params):
     """Construct the query parameter string."""
@@ -72,87 +155,315 @@ def calc_sign(ts, url, param_str, secret):
     return base64.b64encode(hashed).decode()
 
 def transform_data(raw_data, field_mapping):
-    """Transform raw data based on field mapping."""
-    transformed = {}
-    for raw_field, (new_field, dtype, precision, *transforms) in field_mapping.items():
-        if raw_field in raw_data:
-            value = raw_data[raw_field]
-            # Apply any transformations
-            for transform in transforms:
-                value = transform(value)
-            try:
-                transformed[new_field] = round(dtype(value), precision)
-            except ValueError:
-                print(f"Error converting field {raw_field} with value {value}")
-    return transformed
+    """Transform raw data based on a field mapping or a precompiled plan."""
+    plan = field_mapping if isinstance(field_mapping, tuple) else compile_fields(field_mapping)
+    return run_plan(plan, raw_data)
+
+# Per-site state (fleet mode); without a site the module-level settings and state are used
+def site_credentials(site):
+    """(host, access key, secret key) for a fleet site, or the .env credentials."""
+    if site is None:
+        return host, ak, sk
+    return site.config.get("host", host), site.config["access_key"], site.config["secret_key"]
+
+def site_soc_estimator(site):
+    """The site's SoC estimator, with state kept in soc_state.<site>.json."""
+    if site is None:
+        return soc_estimator
+
+    def build():
+        estimator = estimator_from_env(*file_state_io(suffixed_path(soc_state_path, site.name)))
+        atexit.register(estimator.persist)
+        return estimator
+    return site.state("soc", build)
+
+def build_rollup_engine(devices_raw=None, intervals_raw=None):
+    """RollupEngine over ROLLUP_WINDOWS, or the default windows no shorter than the fastest poll; None if no windows."""
+    if rollup_windows_raw is not None:
+        windows = parse_windows(rollup_windows_raw)
+    else:
+        windows = windows_for_poll(min(load_intervals(load_devices(devices_raw), intervals_raw).values()))
+    return RollupEngine(windows, max_gap=rollup_max_gap) if windows else None
+
+def site_rollup_engine(site):
+    if site is None:
+        if "rollups" not in rollup_state:
+            rollup_state["rollups"] = build_rollup_engine()
+        return rollup_state["rollups"]
+    return site.state("rollups", lambda: build_rollup_engine(site.config["devices"], site.config.get("device_intervals")))
+
+def site_deadband(site):
+    if site is None or deadband is None:
+        return deadband
+    return site.state("deadband", filter_from_env)
 
 # API Call
-def get_device_data(device_id):
-    """Retrieve data from a device."""
-    timestamp = int(time.time() * 1000)
+def get_device_data(device_id, site=None):
+    """Retrieve data from a device (through the fleet site's session and governor when given)."""
+    site_host, site_ak, site_sk = site_credentials(site)
+    session, site_governor = (site.session, site.governor) if site else (http_session, governor)
     url_path = f"/device/data/latest/{device_id}"
     params = {}  # Include any query parameters here
     param_str = get_param_str(params)
-    signature = calc_sign(timestamp, url_path, param_str, sk)
-    
-    url = f"{host}{url_path}"
-    headers = {
-        "Access-Key": ak,
-        "Signature": signature,
-        "Timestamp": str(timestamp),
-    }
-    
+    url = f"{site_host}{url_path}"
+
+    def send():
+        # Re-signed on every retry so the timestamp stays fresh
+        with metrics.span("renogy_sign_seconds"):
+            timestamp = int(time.time() * 1000)
+            signature = calc_sign(timestamp, url_path, param_str, site_sk)
+        headers = {
+            "Access-Key": site_ak,
+            "Signature": signature,
+            "Timestamp": str(timestamp),
+        }
+        with metrics.span("renogy_http_request_seconds"):
+            return session.get(url, headers=headers, params=params, timeout=request_timeout)
+
     # Send request
-    response = requests.get(url, headers=headers, params=params)
+    response = site_governor.call(site_ak, send)
+    if response is None:
+        metrics.inc("renogy_errors", kind="no_response")
+        print(f"Error: no response for device {device_id} (retries exhausted or circuit open)")
+        return None
     if response.status_code == 200:
         return response.json().get("data")
     else:
+        metrics.inc("renogy_errors", kind=f"http_{response.status_code}")
         print(f"Error: {response.status_code} - {response.text}")
         return None
 
 
 # Monitor Devices
-def monitor_devices():
-    """Query and log data for all devices."""
-    devices = load_devices()
+def monitor_devices(devices=None, site=None):
+    """Query and log data for the given devices (default: all configured devices, or all of a fleet site's)."""
+    devices = devices or load_devices(site.config["devices"] if site else None)
+    labels = {"site": site.name} if site else {}
+    site_governor = site.governor if site else governor
+    samples = []
+    timestamp = time.time()
+    cycle = {"fetch": 0.0, "transform": 0.0, "write": 0.0, "errors": 0}
+
+    with metrics.span("renogy_cycle_seconds", **labels) as cycle_span:
+        for device_name, device_id in devices.items():
+            with metrics.span("renogy_device_fetch_seconds", device=device_name, **labels) as span:
+                raw_data = get_device_data(device_id, site)
+            cycle["fetch"] += span.elapsed
+            if not raw_data:
+                cycle["errors"] += 1
+                continue
+            samples.append({"ts": timestamp, "device_id": device_id, "category": DEVICE_CATEGORIES.get(device_name),
+                            "name": device_name, "data": raw_data, **labels})
+
+        if raw_capture and samples:
+            raw_capture.write(samples)
+        process_cycle(samples, timestamp, site, cycle)
+
+    metrics.set("renogy_last_cycle_timestamp_seconds", round(timestamp, 3), **labels)
+    if metrics_log_cycles:
+        print(json.dumps({
+            "event": "cycle", "ts": round(timestamp, 3), **labels, "devices": len(devices), "errors": cycle["errors"],
+            "cycle_ms": round(cycle_span.elapsed * 1000, 1), "fetch_ms": round(cycle["fetch"] * 1000, 1),
+            "transform_ms": round(cycle["transform"] * 1000, 3), "write_ms": round(cycle["write"] * 1000, 3),
+            "retries": site_governor.stats["retries"], "dropped": influx_writer.dropped,
+            "rejected": influx_writer.rejected,
+        }))
+
+
+# Transform and write one cycle
+def process_cycle(samples, timestamp, site=None, cycle=None):
+    """
+    Raw samples of one cycle (the capture format) -> transforms, SoC, deadband ->
+    InfluxDB, and rollups. Shared by monitor_devices and bench/replay_capture.py.
+    """
+    labels = {"site": site.name} if site else {}
+    cycle = cycle if cycle is not None else {"transform": 0.0, "write": 0.0, "errors": 0}
+    soc = site_soc_estimator(site)
+    rollups_engine = site_rollup_engine(site)
+    deadband_filter = site_deadband(site)
     combined_data = []
+    for sample in samples:
+        device_name = sample["name"]
+        plan = DEVICE_PLANS.get(device_name)
+        if not plan:
+            continue
+        with metrics.span("renogy_transform_seconds", device=device_name, **labels) as span:
+            transformed_data = transform_data(sample["data"], plan)
+        cycle["transform"] += span.elapsed
 
-    for device_name, device_id in devices.items():
-        raw_data = get_device_data(device_id)
-        if raw_data:
-            if device_name == "Solar":
-                transformed_data = transform_data(raw_data, SOLAR_CONTROLLER_FIELDS)
-            elif device_name == "Main":
-                transformed_data = transform_data(raw_data, MAIN_SHUNT_FIELDS)
-            elif device_name == "Inverter":
-                transformed_data = transform_data(raw_data, INVERTER_SHUNT_FIELDS)
+        # Append transformed data with the device name
+        if transformed_data:
+            combined_data.append({"device": device_name, "data": transformed_data})
 
-            # Append transformed data with the device name
-            if transformed_data:
-                combined_data.append({"device": device_name, "data": transformed_data})
+            if device_name == "Main" and "AmpsMain" in transformed_data and "VoltsMain" in transformed_data:
+                soc_fields = soc.update(transformed_data["AmpsMain"], transformed_data["VoltsMain"], timestamp)
+                combined_data.append({"device": "Battery", "data": soc_fields})
+        else:
+            metrics.inc("renogy_errors", kind="transform_empty", **labels)
+            cycle["errors"] += 1
 
     if combined_data:
-        write_combined_to_influx(combined_data)
+        with metrics.span("renogy_influx_queue_seconds", **labels) as span:
+            write_combined_to_influx(apply_deadband(combined_data, timestamp, deadband_filter), timestamp, site)
+        cycle["write"] = span.elapsed
+        # Rollups see every sample, not just the ones that passed the deadband
+        if rollups_engine:
+            rollups = []
+            for entry in combined_data:
+                rollups.extend(rollups_engine.add_fields(entry["device"], entry["data"], timestamp))
+            write_rollups_to_influx(rollups, site)
+    return combined_data
 
+# Drop fields that haven't moved past their deadband
+def apply_deadband(combined_data, timestamp, deadband_filter=None):
+    """Entries holding only the fields to write; step-closing samples carry their own "time"."""
+    return filter_entries(deadband_filter or deadband, combined_data, timestamp,
+                          lambda entry: {entry["device"]: entry["data"]},
+                          lambda entry, device, fields, ts: {"device": device, "data": fields, "time": ts})
 
 # Write Combined Data to InfluxDB
-def write_combined_to_influx(combined_data):
-    """Write combined data to InfluxDB with proper device tagging."""
-    with client.write_api(write_options=WriteOptions(batch_size=1)) as write_api:
-        for entry in combined_data:
-            device_name = entry["device"]
-            data = entry["data"]
-
-            # Create a Point for each device's data
-            point = Point("PowerMonitoring").tag("device", device_name)
-            for key, value in data.items():
-                if isinstance(value, (int, float)):
-                    point.field(key, value)
-            write_api.write(bucket=influx_bucket, record=point)
+def write_combined_to_influx(combined_data, timestamp=None, site=None):
+    """Queue combined data for the background InfluxDB writer with proper device (and fleet site) tagging."""
+    timestamp = timestamp or time.time()
+    points = []
+    for entry in combined_data:
+        device_name = entry["device"]
+        data = entry["data"]
+
+        # Create a Point for each device's data (timestamped so spooled points replay in place)
+        point = (Point("PowerMonitoring").tag("device", device_name)
+                 .time(int(entry.get("time", timestamp)), WritePrecision.S))
+        if site:
+            point.tag("site", site.name)
+        for key, value in data.items():
+            if isinstance(value, (int, float)):
+                point.field(key, value)
+        points.append(point)
+    influx_writer.write(points)
+
+# Write closed rollup windows to InfluxDB (one point per window/device)
+def write_rollups_to_influx(rollups, site=None):
+    """Queue rollups as PowerMonitoring_<window> points with <field>_<stat> fields."""
+    points = {}
+    for rollup in rollups:
+        key = (rollup["label"], rollup["device"], rollup["start"])
+        if key not in points:
+            points[key] = (Point(f"PowerMonitoring_{rollup['label']}").tag("device", rollup["device"])
+                           .time(int(rollup["start"]), WritePrecision.S))
+            if site:
+                points[key].tag("site", site.name)
+        point = points[key]
+        for stat in ("min", "max", "mean", "last", "Wh", "Ah"):
+            if stat in rollup:
+                point.field(f"{rollup['measure']}_{stat}", round(rollup[stat], 4))
+    if points:
+        influx_writer.write(points.values())
+
+# Scheduler
+def run_scheduler(devices=None, max_ticks=None, site=None):
+    """
+    Poll each device on its own cadence on a drift-free grid (renogy_schedule).
+
+    If a cycle overruns, the missed ticks are skipped rather than run back-to-back.
+    Schedule lag and skipped ticks are written to InfluxDB as the
+    "CollectorSchedule" measurement.
+    """
+    devices = devices or load_devices(site.config["devices"] if site else None)
+    intervals = load_intervals(devices, site.config.get("device_intervals") if site else None)
+    schedule = GridSchedule(intervals, schedule_jitter)
+    ticks = 0
+
+    while max_ticks is None or ticks < max_ticks:
+        lags = schedule.wait()
+        due = {name: devices[name] for name in lags}
+        try:
+            monitor_devices(due, site)
+        except Exception as e:
+            # One bad response or config entry must not stop this device (or fleet site) for good
+            metrics.inc("renogy_errors", kind="cycle", **({"site": site.name} if site else {}))
+            print(f"Error polling {list(due)}{f' ({site.name})' if site else ''}: {e}")
+
+        # Advance each polled device to its next future grid slot, skipping missed ticks
+        skipped = schedule.advance(due)
+        if any(skipped.values()):
+            print(f"Schedule behind{f' ({site.name})' if site else ''} (max lag {max(lags.values()):.1f}s); "
+                  f"skipped ticks: {skipped}")
+
+        timestamp = time.time()
+        points = []
+        for name in due:
+            point = (Point("CollectorSchedule").tag("device", name)
+                     .field("lag_ms", round(lags[name] * 1000, 1))
+                     .field("skipped", skipped[name])
+                     .field("interval", intervals[name])
+                     .time(int(timestamp), WritePrecision.S))
+            if site:
+                point.tag("site", site.name)
+            points.append(point)
+        influx_writer.write(points)
+        ticks += 1
+
+# Fleet Mode
+def run_fleet(worker=0, workers=1, max_ticks=None):
+    """
+    Poll every site the hash ring assigns to this worker, each on its own scheduler
+    thread with its own session and governor, so a slow or throttled site never
+    delays the others. The registry is read once at start. Returns 1 as soon as a
+    site thread dies (e.g. a site without "devices"), so the supervisor restarts
+    the worker instead of the site silently going uncollected.
+    """
+    # Devices of a site are polled in turn, so one pooled connection per site is enough
+    sites = Fleet(pool_size=1).assign(load_registry(fleet_registry), worker, workers)
+    print(f"Fleet worker {worker}/{workers}: {len(sites)} site(s) {[site.name for site in sites]}")
+    for site in sites:
+        metrics.add_collector(lambda site=site: [
+            *((f"renogy_api_{key}", "counter", {"site": site.name}, value) for key, value in site.governor.stats.items()),
+            *((f"renogy_deadband_{key}", "counter", {"site": site.name}, value)
+              for key, value in (site_deadband(site).stats if deadband else {}).items()),
+        ])
+    failed = []
+
+    def run_site(site):
+        try:
+            run_scheduler(max_ticks=max_ticks, site=site)
+        except Exception as e:
+            print(f"Site {site.name} stopped: {e!r}")
+            failed.append(site.name)
+
+    threads = [threading.Thread(target=run_site, args=(site,), name=f"site-{site.name}", daemon=True)
+               for site in sites]
+    for thread in threads:
+        thread.start()
+    while not failed and any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+    return 1 if failed else 0
+
+def supervise_fleet(workers):
+    """Start one worker process per hash-ring slot (FLEET_WORKER=i); stop them all and fail when any exits."""
+    command = [sys.executable] if getattr(sys, "frozen", False) else [sys.executable, os.path.abspath(__file__)]
+    processes = [subprocess.Popen(command, env={**os.environ, "FLEET_WORKER": str(worker)}) for worker in range(workers)]
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+    return 1
 
 # Main Loop
 if __name__ == "__main__":
+    if fleet_registry and fleet_workers > 1 and fleet_worker is None:
+        print(f"Starting Renogy fleet monitoring with {fleet_workers} workers...")
+        sys.exit(supervise_fleet(fleet_workers))
     print("Starting Renogy monitoring...")
-    while True:
-        monitor_devices()
-        time.sleep(collect_interval)
\ No newline at end of file
+    if metrics_port:
+        start_metrics_server(metrics, metrics_port, metrics_host)
+        print(f"Serving metrics on http://{metrics_host}:{metrics_port}/metrics")
+    if fleet_registry:
+        sys.exit(run_fleet(int(fleet_worker or 0), fleet_workers))
+    else:
+        run_scheduler()
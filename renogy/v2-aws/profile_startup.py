@@ -0,0 +1,57 @@
+"""
+Cold-start profile for renogy_ingest.
+
+Imports renogy_ingest in a fresh interpreter under `-X importtime` and reports
+the slowest imports (cumulative and self time), module init duration and,
+with --clients, how long each lazily created boto3 client takes to build.
+
+    python3 profile_startup.py
+    python3 profile_startup.py --clients secretsmanager timestream-write cloudwatch --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def profile(clients=(), top=10):
+    code = (
+        "import json, renogy_ingest as m\n"
+        f"for service in {list(clients)!r}: m.get_aws_client(service)\n"
+        "print(json.dumps(m.startup_timings))\n"
+    )
+    env = dict(os.environ, RENOGY_PROFILE_STARTUP="1")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))  # nested imports stay indented
+
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    total_us = sum(self_us for _, self_us, _ in imports)
+    print(f"Module init: {timings.pop('init_ms')} ms (imports {total_us / 1000:.1f} ms across {len(imports)} modules)")
+    for key, value in timings.items():
+        print(f"  {key}: {value} ms")
+
+    # Top-level packages only for cumulative time (nested names are included in their parent)
+    print(f"\nTop {top} top-level imports by cumulative time:")
+    for name, _, cumulative_us in sorted((i for i in imports if not i[0].startswith(" ")), key=lambda i: -i[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    print(f"\nTop {top} modules by self time:")
+    for name, self_us, _ in sorted(imports, key=lambda i: -i[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name.strip()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time and init profile for renogy_ingest")
+    parser.add_argument("--clients", nargs="*", default=[], help="boto3 services to build after import")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    profile(args.clients, args.top)
@@ -0,0 +1,122 @@
+####################
+# CLOUDWATCH METRIC PUBLISHER
+# EMF: metrics are printed as CloudWatch Embedded Metric Format JSON lines, which
+# Lambda's log stream turns into metrics with no API calls.
+# API: put_metric_data with repeated values folded into Values/Counts arrays and
+# requests chunked to the API limits.
+#####################
+import json
+import time
+
+EMF_MAX_METRICS = 100        # metric definitions per EMF directive
+EMF_MAX_VALUES = 100         # values per metric in one EMF document
+API_MAX_DATUMS = 1000        # MetricData entries per put_metric_data request
+API_MAX_VALUES = 150         # distinct Values per datum
+API_MAX_BYTES = 900 * 1024   # stay under the 1 MB request payload limit
+
+
+class MetricPublisher:
+    """Collect metrics with add(), then publish them all with flush()."""
+
+    def __init__(self, namespace, mode="EMF", high_resolution=False, client=None, emit=print,
+                 max_datums=API_MAX_DATUMS):
+        self.namespace = namespace
+        self.mode = mode.upper()
+        self.storage_resolution = 1 if high_resolution else 60
+        self.client = client  # callable returning the cloudwatch client (API mode only)
+        self.emit = emit
+        self.max_datums = max_datums
+        self.requests = 0
+        self._metrics = {}  # (name, unit, dimensions) -> [values]
+
+    def add(self, name, value, unit="None", dimensions=None):
+        """Queue one value; dimensions is a {name: value} dict."""
+        if value is None:
+            return
+        key = (name, unit, tuple(sorted((dimensions or {}).items())))
+        self._metrics.setdefault(key, []).append(float(value))
+
+    def __len__(self):
+        return sum(len(values) for values in self._metrics.values())
+
+    def flush(self, timestamp=None):
+        """Publish and clear queued metrics; returns the number of values published."""
+        if not self._metrics:
+            return 0
+        timestamp = time.time() if timestamp is None else timestamp
+        count = len(self)
+        if self.mode == "EMF":
+            for document in self.emf_documents(timestamp):
+                self.emit(json.dumps(document, separators=(",", ":")))
+        else:
+            for metric_data in self.api_requests(timestamp):
+                self.client().put_metric_data(Namespace=self.namespace, MetricData=metric_data)
+                self.requests += 1
+        self._metrics.clear()
+        return count
+
+    def emf_documents(self, timestamp):
+        """One EMF document per dimension set, split to the per-directive metric and value limits."""
+        by_dimensions = {}
+        for (name, unit, dimensions), values in self._metrics.items():
+            by_dimensions.setdefault(dimensions, []).append((name, unit, values))
+
+        documents = []
+        for dimensions, metrics in by_dimensions.items():
+            for offset in range(0, len(metrics), EMF_MAX_METRICS):
+                chunk = metrics[offset:offset + EMF_MAX_METRICS]
+                depth = max(len(values) for _, _, values in chunk)
+                for start in range(0, depth, EMF_MAX_VALUES):
+                    document = {"_aws": {
+                        "Timestamp": int(timestamp * 1000),
+                        "CloudWatchMetrics": [{
+                            "Namespace": self.namespace,
+                            "Dimensions": [[name for name, _ in dimensions]],
+                            "Metrics": [],
+                        }],
+                    }}
+                    document.update(dimensions)
+                    definitions = document["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+                    for name, unit, values in chunk:
+                        part = values[start:start + EMF_MAX_VALUES]
+                        if not part:
+                            continue
+                        definition = {"Name": name, "Unit": unit}
+                        if self.storage_resolution == 1:
+                            definition["StorageResolution"] = 1
+                        definitions.append(definition)
+                        document[name] = part[0] if len(part) == 1 else part
+                    documents.append(document)
+        return documents
+
+    def api_requests(self, timestamp):
+        """MetricData lists with Values/Counts, chunked by datum count and approximate payload size."""
+        datums = []
+        for (name, unit, dimensions), values in self._metrics.items():
+            counts = {}
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+            distinct = list(counts.items())
+            for offset in range(0, len(distinct), API_MAX_VALUES):
+                chunk = distinct[offset:offset + API_MAX_VALUES]
+                datums.append({
+                    "MetricName": name,
+                    "Dimensions": [{"Name": key, "Value": value} for key, value in dimensions],
+                    "Timestamp": timestamp,
+                    "Values": [value for value, _ in chunk],
+                    "Counts": [float(count) for _, count in chunk],
+                    "Unit": unit,
+                    "StorageResolution": self.storage_resolution,
+                })
+
+        requests, current, size = [], [], 0
+        for datum in datums:
+            datum_size = len(json.dumps(datum, default=str))
+            if current and (len(current) >= self.max_datums or size + datum_size > API_MAX_BYTES):
+                requests.append(current)
+                current, size = [], 0
+            current.append(datum)
+            size += datum_size
+        if current:
+            requests.append(current)
+        return requests
@@ -1,65 +1,120 @@
+import time
+_init_started = time.perf_counter()
 import sys
 import os
 
-# Add the dependencies folder to the Python path
+# Add the dependencies folder to the Python path (only if it was packaged)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 dependencies_dir = os.path.join(current_dir, "dependencies")
-sys.path.append(dependencies_dir)
+if os.path.isdir(dependencies_dir):
+    sys.path.append(dependencies_dir)
+# Shared renogy_*.py modules (copied next to this file when packaging the Lambda)
+if not os.path.exists(os.path.join(current_dir, "renogy_transform.py")):
+    sys.path.append(os.path.dirname(current_dir))
 
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import hmac
 import base64
 import json
 from urllib.parse import urlencode
-import boto3
-from datetime import datetime
 import logging
+from functools import lru_cache
+from renogy_store import MeasurementStore
+from renogy_transform import run_plan, run_plan_batch
+from renogy_fields import CATEGORY_PLANS, CONTROLLER_MEASURES, SHUNT_MEASURES
+from renogy_governor import build_session, governor_from_env
+from renogy_rollup import RollupEngine, parse_windows
+from renogy_derived import DerivedEngine
+from renogy_soc import estimator_from_env
+from renogy_state import file_state_io
+from renogy_capture import capture_from_env
+from renogy_cloudwatch import MetricPublisher
+from renogy_fleet import Fleet, parse_registry, run_sites, suffixed_path
+from renogy_deadband import filter_entries, filter_from_env
+# AWS clients, warm cache, S3 state and Timestream writer (shared with the Peplink Lambda)
+from renogy_aws import (
+    CACHE_TTL_SECRETS, TIMESTREAM_MAX_RECORDS, TIMESTREAM_MULTI_MEASURE_NAME, aws_clients, cache_stats, cached,
+    get_aws_client, invalidate_cache, s3_state_io, startup_timings, write_timestream_batch, write_to_timestream,
+)
 
 #################### 
 # Init Boto and Renogy API 
 #####################
-cloudwatch_client = boto3.client("cloudwatch")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-timestream_client = boto3.client("timestream-write")
+
+# Startup profiling: init duration and lazy client build times (see profile_startup.py for imports)
+PROFILE_STARTUP = os.getenv("RENOGY_PROFILE_STARTUP", "").lower() in ("1", "true", "yes")
+_cold_start = True
+
+# Concurrent device polling over one keep-alive session (reused across warm invocations)
+MAX_WORKERS = int(os.getenv("RENOGY_MAX_WORKERS", 8))
+REQUEST_TIMEOUT = float(os.getenv("RENOGY_REQUEST_TIMEOUT", 10))
+
+http_session = build_session(MAX_WORKERS)
+# Token bucket, retry/backoff and circuit breaker shared by every Renogy API call
+governor = governor_from_env()
+
+# Warm-invocation cache TTL for the device inventory (secrets: CACHE_TTL_SECRETS, see renogy_aws)
+CACHE_TTL_DEVICES = float(os.getenv("CACHE_TTL_DEVICES", 900))
+
+def site_key(key, site=None):
+    """Cache key for one fleet site ("secrets" -> "secrets:<site>"); unchanged outside fleet mode."""
+    return f"{key}:{site.name}" if site else key
+
+SITE_CACHE_KEYS = ("secrets", "device_list", "device_info")
 
 #################### 
 # HELPER FUNCTIONS Secrets, Signature, Devices, DeviceDetail
 #####################
-def get_renogy_secrets():
+def get_renogy_secrets(secret_name=None):
     """Retrieve secrets from AWS Secrets Manager."""
-    secrets_client = boto3.client("secretsmanager")
-    secret_name = os.getenv("RENOGY_SECRET_NAME", "renogy_api_secrets")
+    secrets_client = get_aws_client("secretsmanager")
+    secret_name = secret_name or os.getenv("RENOGY_SECRET_NAME", "renogy_api_secrets")
 
     response = secrets_client.get_secret_value(SecretId=secret_name)
     secret = json.loads(response["SecretString"])
     return secret["SECRET_KEY"], secret["ACCESS_KEY"]
 
 # Calculate signature
+@lru_cache(maxsize=8)
+def _signing_key(secret):
+    """Keyed HMAC state for a secret, built once and copied per signature."""
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
 def calc_sign(ts, url, param_str, secret):
     """Calculate the signature."""
     to_sign = f"{ts}.{url}.{param_str}"
-    hashed = hmac.new(secret.encode(), to_sign.encode(), hashlib.sha256).digest()
-    return base64.b64encode(hashed).decode()
-
-# Get device list
-def get_device_list(host, ak, sk):
-    """Retrieve the list of devices."""
-    timestamp = int(time.time() * 1000)
-    url_path = "/device/list"
+    signer = _signing_key(secret).copy()
+    signer.update(to_sign.encode())
+    return base64.b64encode(signer.digest()).decode()
+
+# Signed GET through the governor (re-signed on every retry so the timestamp stays fresh)
+def signed_get(url_path, host, ak, sk, session=None, site=None):
+    """Send a signed GET (with the fleet site's session and governor when given); returns the Response, or None if the governor gave up."""
+    session = session or (site.session if site else http_session)
     param_str = ""
-    signature = calc_sign(timestamp, url_path, param_str, sk)
 
-    url = f"{host}{url_path}"
-    headers = {
-        "Access-Key": ak,
-        "Signature": signature,
-        "Timestamp": str(timestamp),
-    }
+    def send():
+        timestamp = int(time.time() * 1000)
+        signature = calc_sign(timestamp, url_path, param_str, sk)
+        headers = {
+            "Access-Key": ak,
+            "Signature": signature,
+            "Timestamp": str(timestamp),
+        }
+        return session.get(f"{host}{url_path}", headers=headers, timeout=REQUEST_TIMEOUT)
 
-    response = requests.get(url, headers=headers)
+    return (site.governor if site else governor).call(ak, send)
+
+# Get device list
+def get_device_list(host, ak, sk, site=None):
+    """Retrieve the list of devices."""
+    response = signed_get("/device/list", host, ak, sk, site=site)
+    if response is None:
+        print("Error fetching device list: no response (retries exhausted or circuit open)")
+        return []
     if response.status_code == 200:
         try:
             devices = response.json()
@@ -95,290 +150,493 @@ def extract_device_info(devices):
 #################### 
 # GET DEVICE DATA 
 #####################
-def get_device_data(device_id, host, ak, sk):
+def get_device_data(device_id, host, ak, sk, session=None, site=None):
     """Retrieve data for a specific device."""
-    timestamp = int(time.time() * 1000)
-    url_path = f"/device/data/latest/{device_id}"
-    param_str = ""
-    signature = calc_sign(timestamp, url_path, param_str, sk)
-
-    url = f"{host}{url_path}"
-    headers = {
-        "Access-Key": ak,
-        "Signature": signature,
-        "Timestamp": str(timestamp),
-    }
-
-    response = requests.get(url, headers=headers)
+    response = signed_get(f"/device/data/latest/{device_id}", host, ak, sk, session, site)
+    if response is None:
+        logger.error(f"Error fetching data for device {device_id}: no response (retries exhausted or circuit open)")
+        return None
     if response.status_code == 200:
         return response.json().get("data")
         logger.info(f"Retrieved data for device {device_id}: {data}")
         print(f"Retrieved data for device {device_id}: {data}")
     else:
         logger.error(f"Error fetching data for device {device_id}: {response.status_code} - {response.text}")
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            # Stale credentials or a removed device; refresh both (for this site only) on the next invocation
+            invalidate_cache(*(site_key(key, site) for key in SITE_CACHE_KEYS) if site else ())
         return None
     
+def fetch_all_device_data(device_info, host, ak, sk, session=None, max_workers=MAX_WORKERS, site=None):
+    """Query all devices concurrently; returns raw data (or None) in device_info order."""
+    session = session or (site.session if site else http_session)
+
+    def fetch(device):
+        # Isolate failures so one bad device doesn't sink the whole cycle
+        try:
+            return get_device_data(device["deviceId"], host, ak, sk, session, site)
+        except Exception as e:
+            logger.error(f"Error fetching data for device {device['deviceId']}: {e}")
+            return None
+
+    if not device_info:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(device_info)))) as executor:
+        return list(executor.map(fetch, device_info))
+
+# Optional raw response capture (RAW_CAPTURE_DIR, e.g. /tmp/renogy_capture); closed files go to
+# s3://RAW_CAPTURE_BUCKET/RAW_CAPTURE_PREFIX when set
+RAW_CAPTURE_BUCKET = os.getenv("RAW_CAPTURE_BUCKET")
+RAW_CAPTURE_PREFIX = os.getenv("RAW_CAPTURE_PREFIX", "renogy/raw/")
+
+def upload_capture(path):
+    get_aws_client("s3").upload_file(path, RAW_CAPTURE_BUCKET, RAW_CAPTURE_PREFIX + os.path.basename(path))
+    os.remove(path)
+
+raw_capture = capture_from_env("lambda", on_rotate=upload_capture if RAW_CAPTURE_BUCKET else None)
+
 #################### 
 # PROCESS DEVICE DATA 
 #####################
-def process_device_data(device_data, category, device_id, name, sku):
-    """Process device data based on category."""
-    transformed = []
-
-    # Define uname based on category
-    if category == "Controller":
-        uname = f"mppt-{device_id[-3:]}"
-        # MPPT (primary: sub="pri")
-        amps_mpt = device_data.get("gridChargeAmps", 0.0) / 1000
-        volts_mpt = device_data.get("auxiliaryBatteryChargingVolts", 0.0)
-        watts_mpt = amps_mpt * volts_mpt
-        transformed.append({"measure": "amps", "value": round(amps_mpt, 4), "sub": "pri"})
-        transformed.append({"measure": "volt", "value": round(volts_mpt, 4), "sub": "pri"})
-        transformed.append({"measure": "watt", "value": round(watts_mpt, 4), "sub": "pri"})
-
-        # Solar (sub="sol")
-        transformed.append({"measure": "watt", "value": round(device_data.get("solarWatts", 0.0), 4), "sub": "sol"})
-        transformed.append({"measure": "volt", "value": round(device_data.get("solarChargingVolts", 0.0), 4), "sub": "sol"})
-        transformed.append({"measure": "amps", "value": round(device_data.get("solarChargingAmps", 0.0), 4), "sub": "sol"})
-
-        # Load (sub="lod")
-        volts_load = device_data.get("loadVolts", 0.0)
-        amps_load = device_data.get("loadAmps", 0.0)
-        watts_load = volts_load * amps_load
-        transformed.append({"measure": "volt", "value": round(volts_load, 4), "sub": "lod"})
-        transformed.append({"measure": "amps", "value": round(amps_load, 4), "sub": "lod"})
-        transformed.append({"measure": "watt", "value": round(watts_load, 4), "sub": "lod"})
-
-        # Temperature (single value, no sub)
-        battery_temp = (device_data.get("auxiliaryBatteryTemperature", 0.0) * 1.8) + 32
-        transformed.append({"measure": "temp", "value": round(battery_temp, 2), "sub": "pri"})
-
-    elif category == "Battery Shunt":
-        uname = f"shnt-{device_id[-3:]}"
-        # Primary shunt values (sub="pri")
-        volts_shnt = device_data.get("batteryVolts", 0.0)
-        amps_shnt = device_data.get("current", 0.0)
-        watts_shunt = volts_shnt * amps_shnt
-        transformed.append({"measure": "volt", "value": round(volts_shnt, 4), "sub": "pri"})
-        transformed.append({"measure": "amps", "value": round(amps_shnt, 4), "sub": "pri"})
-        transformed.append({"measure": "watt", "value": round(watts_shunt, 4), "sub": "pri"})
-
-    else:
+def _build_records(keys, values, category, device_id, name, sku, uname):
+    """Expand parallel (sub, measure) keys and values into flat measurement records."""
+    return [
+        {"measure": measure, "value": value, "sub": sub, "category": category,
+         "device_id": device_id, "name": name, "sku": sku, "uname": uname}
+        for (sub, measure), value in zip(keys, values) if value is not None
+    ]
+
+def process_device_data(device_data, category, device_id, name, sku, store=None):
+    """Process device data based on category (optionally indexing results into store)."""
+    if category not in CATEGORY_PLANS:
         print(f"No transformation rules for category: {category}")
         return []
 
-    # Add common fields to each measurement
-    for item in transformed:
-        item.update({
-            "category": category,
-            "device_id": device_id,
-            "name": name,
-            "sku": sku,
-            "uname": uname
-        })
+    prefix, plan = CATEGORY_PLANS[category]
+    uname = f"{prefix}-{device_id[-3:]}"
+    values = run_plan(plan, device_data, default=0.0)
+    transformed = _build_records(values.keys(), values.values(), category, device_id, name, sku, uname)
+
+    if store is not None:
+        store.extend(transformed)
 
     print(f"Transformed native system load data: {transformed}")
     return transformed
 
+def process_device_data_batch(samples, category, device_id, name, sku):
+    """Process many samples of one device at once (backfills); returns a list of record lists."""
+    if category not in CATEGORY_PLANS:
+        print(f"No transformation rules for category: {category}")
+        return []
+
+    prefix, plan = CATEGORY_PLANS[category]
+    uname = f"{prefix}-{device_id[-3:]}"
+    columns = run_plan_batch(plan, samples, default=0.0)
+    keys = list(columns)
+    return [
+        _build_records(keys, row, category, device_id, name, sku, uname)
+        for row in zip(*columns.values())
+    ]
+
 #################### 
-# CALCULATE SYSTEM LOAD 
+# CALCULATE DERIVED METRICS (SYSTEM LOAD, INVERTER DRAW)
 #####################
-def calculate_system_load(transformed_data):
-    """Calculate derived system load metrics."""
+# Derived devices: formulas over {uname/sub/measure} inputs (other derived outputs allowed).
+# Override with a JSON file of the same shape via DERIVED_METRICS_FILE.
+DEFAULT_DERIVED_DEVICES = {
+    # DC system load: main shunt minus inverter shunt and MPPT charge
+    "load-001": {
+        "device_id": "derived-001", "name": "RNG-SYST", "sku": "RNG-SYST",
+        "measures": {
+            "pri/amps": "-(({shnt-258/pri/amps} + {mppt-914/pri/amps}) - {shnt-071/pri/amps})",
+            "pri/watt": "-(({shnt-258/pri/watt} + {mppt-914/pri/watt}) - {shnt-071/pri/watt})",
+            "pri/volt": "{shnt-071/pri/volt}",
+        },
+    },
+    # Inverter draw (positive while the inverter pulls from the bank)
+    "inv-001": {
+        "device_id": "derived-002", "name": "RNG-INV", "sku": "RNG-SYST",
+        "measures": {
+            "pri/amps": "-{shnt-258/pri/amps}",
+            "pri/watt": "-{shnt-258/pri/watt}",
+        },
+    },
+}
+
+def load_derived_devices():
+    """Derived device definitions from DERIVED_METRICS_FILE, or the defaults."""
+    path = os.getenv("DERIVED_METRICS_FILE")
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return DEFAULT_DERIVED_DEVICES
+
+DERIVED_DEVICES = load_derived_devices()
+
+def build_derived_engine(derived_devices=None):
+    """Compile derived device formulas into one incremental DAG."""
+    derived_devices = derived_devices or DERIVED_DEVICES
+    formulas = {
+        (uname, *key.split("/")): expr
+        for uname, spec in derived_devices.items()
+        for key, expr in spec["measures"].items()
+    }
+    return DerivedEngine(formulas, precision=4, max_age=float(os.getenv("DERIVED_MAX_AGE", 900)))
+
+# Kept across warm invocations so stale inputs fall back to their last known value
+derived_engine = build_derived_engine()
+
+def site_uname(site, uname):
+    """A fleet site's own uname for one of the reference unames above (its "aliases" map), else uname."""
+    return site.config.get("aliases", {}).get(uname, uname) if site else uname
+
+def site_derived_devices(site):
+    """The site's "derived" definitions, or the defaults with the site's aliases substituted."""
+    if site is None:
+        return DERIVED_DEVICES
+    if "derived" in site.config:
+        return site.config["derived"]
+    aliases = site.config.get("aliases", {})
+    derived = json.dumps(DERIVED_DEVICES)
+    for uname, alias in aliases.items():
+        derived = derived.replace(f"{{{uname}/", f"{{{alias}/")
+    return json.loads(derived)
+
+def calculate_system_load(transformed_data, engine=None, derived_devices=None):
+    """Evaluate derived metrics from a MeasurementStore (or flat list); returns derived records."""
+    engine = engine or derived_engine
+    derived_devices = derived_devices or DERIVED_DEVICES
+    if not isinstance(transformed_data, MeasurementStore):
+        transformed_data = MeasurementStore(transformed_data)
+
+    derived = []
+    for (uname, sub, measure), value in engine.update_from_store(transformed_data).items():
+        spec = derived_devices.get(uname, {})
+        derived.append({
+            "measure": measure, "value": value, "sub": sub,
+            "device_id": spec.get("device_id", f"derived-{uname}"),
+            "uname": uname,
+            "name": spec.get("name", uname),
+            "category": "Derived",
+            "sku": spec.get("sku", "RNG-SYST"),
+        })
+
+    if not derived:
+        print("Error calculating derived metrics: Missing data for calculation.")
+    print(f"Derived system data: {derived}")
+    return derived
+
+####################
+# STATE OF CHARGE (COULOMB COUNTING FROM THE MAIN SHUNT)
+####################
+# State persists to S3 when SOC_STATE_BUCKET is set (survives cold starts), else to /tmp
+SOC_DEVICE = {"uname": "batt-001", "device_id": "derived-004", "name": "RNG-BATT", "sku": "RNG-SYST"}
+SOC_MEASURES = {"SoC": "soc", "AhRemaining": "ah", "WhInToday": "wh_in", "WhOutToday": "wh_out"}
+SOC_STATE_BUCKET = os.getenv("SOC_STATE_BUCKET")
+SOC_STATE_KEY = os.getenv("SOC_STATE_KEY", "renogy/soc_state.json")
+_soc_estimator = None
+
+def _build_soc_estimator(suffix=None):
+    if SOC_STATE_BUCKET:
+        key = suffixed_path(SOC_STATE_KEY, suffix) if suffix else SOC_STATE_KEY
+        state_io = s3_state_io(SOC_STATE_BUCKET, key)
+    else:
+        path = os.getenv("SOC_STATE_PATH", "/tmp/renogy_soc_state.json")
+        state_io = file_state_io(suffixed_path(path, suffix) if suffix else path)
+    return estimator_from_env(*state_io)
+
+def get_soc_estimator(site=None):
+    """Build the estimator on first use (loads persisted state) and reuse it across warm invocations."""
+    global _soc_estimator
+    if site:
+        # Each fleet site keeps its own state object (soc_state.<site>.json)
+        return site.state("soc", lambda: _build_soc_estimator(site.name))
+    if _soc_estimator is None:
+        _soc_estimator = _build_soc_estimator()
+    return _soc_estimator
+
+def calculate_state_of_charge(store, sample_time=None, site=None):
+    """Advance SoC from the main shunt (shnt-071, or the site's alias for it) sample; returns battery records (empty if no sample)."""
+    shunt = site_uname(site, "shnt-071")
     try:
-        # Extract relevant measurements from transformed data
-        shnt_258_amps = next(item for item in transformed_data if item["uname"] == "shnt-258" and item["sub"] == "pri" and item["measure"] == "amps")["value"]
-        mppt_914_amps = next(item for item in transformed_data if item["uname"] == "mppt-914" and item["sub"] == "pri" and item["measure"] == "amps")["value"]
-        shnt_071_amps = next(item for item in transformed_data if item["uname"] == "shnt-071" and item["sub"] == "pri" and item["measure"] == "amps")["value"]
-
-        shnt_258_watts = next(item for item in transformed_data if item["uname"] == "shnt-258" and item["sub"] == "pri" and item["measure"] == "watt")["value"]
-        mppt_914_watts = next(item for item in transformed_data if item["uname"] == "mppt-914" and item["sub"] == "pri" and item["measure"] == "watt")["value"]
-        shnt_071_watts = next(item for item in transformed_data if item["uname"] == "shnt-071" and item["sub"] == "pri" and item["measure"] == "watt")["value"]
-
-        shnt_071_volts = next(item for item in transformed_data if item["uname"] == "shnt-071" and item["sub"] == "pri" and item["measure"] == "volt")["value"]
-
-        # Derived values
-        load_amps = (-1.0 * ((shnt_258_amps + mppt_914_amps) - shnt_071_amps))
-        load_watts = (-1.0 * ((shnt_258_watts + mppt_914_watts) - shnt_071_watts))
-        load_volts = shnt_071_volts
-
-        # Add derived device measurements
-        derived_device = [
-            {"measure": "amps", "value": round(load_amps, 4), "sub": "pri"},
-            {"measure": "watt", "value": round(load_watts, 4), "sub": "pri"},
-            {"measure": "volt", "value": round(load_volts, 4), "sub": "pri"}
-        ]
-
-        # Add common fields to the derived device
-        for item in derived_device:
-            try:
-                item.update({
-                    "device_id": "derived-001",  # Placeholder for derived metrics
-                    "uname": "load-001",
-                    "name": "RNG-SYST",
-                    "category": "Derived",
-                    "sku": "RNG-SYST"
-                })
-            except KeyError as e:
-                logger.error(f"Derived data missing keys: {item}. Error: {e}")
-
-        print(f"Derived system load data: {derived_device}")
-        return derived_device
-
-    except StopIteration as e:
-        print(f"Error calculating derived system load: Missing data for calculation. {e}")
+        amps = store.value(shunt, "pri", "amps")
+        volts = store.value(shunt, "pri", "volt")
+    except KeyError:
+        print("Error calculating state of charge: Missing main shunt data.")
         return []
 
-#################### 
-# PUBLISH TO TIMESTREAM 
-#####################
-def write_to_timestream(combined_data, db, table):
-    # Write data to Timestream
-    # Define required keys for validation
-    required_keys = ["device_id", "uname", "sub", "category", "name", "sku", "measure", "value"]
-    for entry in combined_data:
-        records = []
-        # Get current time in milliseconds since epoch
-        current_time_ms = int(datetime.now().replace(second=0, microsecond=0).timestamp() * 1000)
-
-        for index, entry in enumerate(combined_data):
-            for item in entry:
-                 # Log invalid records
-                if not all(key in item for key in required_keys):
-                    logger.warning(f"Skipping record due to missing keys: {item}")
-                    print(f"Skipping record due to missing keys: {item}")
-                    continue  # Skip invalid records
-
-                records.append({
-                    "MeasureName": item["measure"],
-                    "MeasureValue": str(item["value"]),
-                    "MeasureValueType": "DOUBLE",
-                    "Time": str(current_time_ms),  # Use milliseconds since epoch
-                    "TimeUnit": "MILLISECONDS",
-                    "Dimensions": [
-                        {"Name": "device_id", "Value": item["device_id"]},
-                        {"Name": "uname", "Value": item["uname"]},
-                        {"Name": "sub", "Value": item["sub"]},
-                        {"Name": "category", "Value": item["category"]},
-                        {"Name": "name", "Value": item["name"]},
-                        {"Name": "sku", "Value": item["sku"]},
-                    ]
-                })
-
-    # Log and write records to Timestream
-    logger.info(f"Writing {len(records)} records to Timestream for table: {table}")
-    if records:
-        try:
-            timestream_client.write_records(
-                DatabaseName=db,
-                TableName=table,
-                Records=records
-            )
-            logger.info("Successfully wrote records to Timestream")
-        except Exception as e:
-            logger.error(f"Error writing records to Timestream: {e}")
-            if hasattr(e, 'response') and 'RejectedRecords' in e.response['Error']:
-                logger.error(f"RejectedRecords details: {e.response['Error']['RejectedRecords']}")
+    fields = get_soc_estimator(site).update(amps, volts, sample_time)
+    return [
+        {"measure": SOC_MEASURES[field], "value": value, "sub": "pri", "category": "Derived", **SOC_DEVICE}
+        for field, value in fields.items()
+    ]
+
+####################
+# DEADBAND / ON-CHANGE FILTER
+####################
+# Opt-in via DEADBAND_RULES (e.g. volt:0.02,amps:0.1,watt:2%). Filter state lives in
+# the warm container, so the first invocation after a cold start writes every record.
+deadband = filter_from_env()
+
+def apply_deadband(combined_data, sample_time, deadband_filter=None):
+    """Records that moved past their deadband per uname/sub/measure; step-closing copies carry their own "time" (ms)."""
+    def split(entry):
+        by_device = {}
+        for item in entry:
+            by_device.setdefault((item["uname"], item["sub"]), {})[item["measure"]] = item["value"]
+        return by_device
+
+    def build(entry, device, fields, ts):
+        items = [item for item in entry if (item["uname"], item["sub"]) == device and item["measure"] in fields]
+        if ts == sample_time:
+            return items
+        return [{**item, "value": fields[item["measure"]], "time": int(ts * 1000)} for item in items]
+
+    return filter_entries(deadband_filter or deadband, combined_data, sample_time, split, build)
+
+####################
+# ROLLUPS TO TIMESTREAM
+####################
+# Opt-in (e.g. ROLLUP_WINDOWS=900,3600). State lives in the warm container, so a
+# window spanning a cold start is written with the samples seen since then.
+ROLLUP_WINDOWS = parse_windows(os.getenv("ROLLUP_WINDOWS", ""))
+rollup_engine = RollupEngine(ROLLUP_WINDOWS, max_gap=float(os.getenv("ROLLUP_MAX_GAP", 600))) if ROLLUP_WINDOWS else None
+ROLLUP_COLUMNS = (("min", "val_min"), ("max", "val_max"), ("mean", "val_mean"), ("last", "val_last"), ("Wh", "wh"), ("Ah", "ah"))
+
+def write_rollups_to_timestream(rollups, db, table, site=None):
+    """Write closed windows as MULTI records to <table>_<window> (e.g. renogy_data_15m)."""
+    by_table = {}
+    for rollup in rollups:
+        uname, sub = rollup["device"]
+        values = [{"Name": column, "Value": str(round(rollup[stat], 4)), "Type": "DOUBLE"}
+                  for stat, column in ROLLUP_COLUMNS if stat in rollup]
+        values.append({"Name": "samples", "Value": str(rollup["count"]), "Type": "BIGINT"})
+        dimensions = [{"Name": "uname", "Value": uname}, {"Name": "sub", "Value": sub}]
+        if site:
+            dimensions.append({"Name": "site", "Value": site.name})
+        by_table.setdefault(f"{table}_{rollup['label']}", []).append({
+            "Dimensions": dimensions,
+            "MeasureName": rollup["measure"],
+            "MeasureValues": values,
+            "Time": str(int(rollup["start"] * 1000)),
+        })
+
+    common = {"MeasureValueType": "MULTI", "TimeUnit": "MILLISECONDS"}
+    for rollup_table, records in by_table.items():
+        for start in range(0, len(records), TIMESTREAM_MAX_RECORDS):
+            write_timestream_batch(db, rollup_table, common, records[start:start + TIMESTREAM_MAX_RECORDS])
+        logger.info(f"Wrote {len(records)} rollup records to Timestream table: {rollup_table}")
 
 ####################
 # PUBLISH MULTIPLE METRICS TO CLOUDWATCH
 ####################
-def publish_metrics_to_cloudwatch(metrics):
-    """Send multiple custom metrics to CloudWatch in a single request."""
+# EMF: metrics as Embedded Metric Format log lines (no API calls); API: chunked put_metric_data
+CLOUDWATCH_NAMESPACE = os.getenv("CLOUDWATCH_NAMESPACE", "RenogyMetrics")
+CLOUDWATCH_MODE = os.getenv("CLOUDWATCH_MODE", "EMF").upper()
+CLOUDWATCH_HIGH_RESOLUTION = os.getenv("CLOUDWATCH_HIGH_RESOLUTION", "").lower() in ("1", "true", "yes")
+# Also publish every measurement as <measure> with Device=<uname>, Sub=<sub> dimensions
+CLOUDWATCH_ALL_MEASURES = os.getenv("CLOUDWATCH_ALL_MEASURES", "").lower() in ("1", "true", "yes")
+
+# Alarm metrics: {metric name: ((uname, sub, measure), unit, Device dimension)}
+CLOUDWATCH_METRICS = {
+    "MainVoltage": (("shnt-071", "pri", "volt"), "None", "Main"),
+    "MainCurrent": (("shnt-071", "pri", "amps"), "None", "Main"),
+    "MPPTVoltage": (("mppt-914", "pri", "volt"), "None", "MPPT"),
+    "MPPTCurrent": (("mppt-914", "pri", "amps"), "None", "MPPT"),
+    "BatterySoC": (("batt-001", "pri", "soc"), "Percent", "Main"),
+}
+
+def build_metric_publisher(mode=None):
+    return MetricPublisher(CLOUDWATCH_NAMESPACE, mode or CLOUDWATCH_MODE, CLOUDWATCH_HIGH_RESOLUTION,
+                           client=lambda: get_aws_client("cloudwatch"))
+
+def publish_metrics_to_cloudwatch(store, publisher=None, site=None):
+    """Publish the alarm metrics (and optionally every measurement) from a MeasurementStore; returns values sent."""
+    publisher = publisher or build_metric_publisher()
+    site_dimension = {"Site": site.name} if site else {}
+    missing = []
+    for metric_name, ((uname, sub, measure), unit, device) in CLOUDWATCH_METRICS.items():
+        item = store.get(site_uname(site, uname), sub, measure)
+        if item is None:
+            missing.append(metric_name)
+        else:
+            publisher.add(metric_name, item["value"], unit, {"Device": device, **site_dimension})
+    if missing:
+        logging.error(f"Required data for metrics not found: {missing}")
+
+    if CLOUDWATCH_ALL_MEASURES:
+        for item in store:
+            publisher.add(item["measure"], item["value"], "None",
+                          {"Device": item["uname"], "Sub": item["sub"], **site_dimension})
+
     try:
-        cloudwatch_client.put_metric_data(
-            Namespace="RenogyMetrics",
-            MetricData=metrics
-        )
-        logging.info(f"Published {len(metrics)} metrics to CloudWatch.")
+        published = publisher.flush()
+        logging.info(f"Published {published} metric values to CloudWatch ({publisher.mode}, {publisher.requests} API calls).")
+        return published
     except Exception as e:
         logging.error(f"Error publishing metrics to CloudWatch: {e}")
+        return 0
 
 
+####################
+# FLEET MODE (MANY SITES / ACCOUNTS)
+####################
+# FLEET_REGISTRY (file path or s3://bucket/key) lists sites; with FLEET_SHARDS > 1 a
+# scheduled invocation fans out one async invocation per shard ({"shard": i, "shards": n})
+# and each shard collects the sites the hash ring assigns it, concurrently.
+FLEET_REGISTRY = os.getenv("FLEET_REGISTRY")
+FLEET_SHARDS = int(os.getenv("FLEET_SHARDS", 1))
+FLEET_SITE_WORKERS = int(os.getenv("FLEET_SITE_WORKERS", 8))
+# Site sessions, governors, derived/SoC/rollup state, kept across warm invocations
+fleet = Fleet(pool_size=MAX_WORKERS)
+
+def load_fleet_registry():
+    """Site configs from FLEET_REGISTRY (local path or s3://bucket/key)."""
+    if FLEET_REGISTRY.startswith("s3://"):
+        bucket, key = FLEET_REGISTRY[5:].split("/", 1)
+        return parse_registry(get_aws_client("s3").get_object(Bucket=bucket, Key=key)["Body"].read())
+    with open(FLEET_REGISTRY) as f:
+        return parse_registry(f.read())
+
+def dispatch_shards(shards, context):
+    """Invoke this function asynchronously once per shard; returns immediately."""
+    function_name = os.getenv("FLEET_FUNCTION_NAME") or context.invoked_function_arn
+    client = get_aws_client("lambda")
+    for shard in range(shards):
+        client.invoke(FunctionName=function_name, InvocationType="Event",
+                      Payload=json.dumps({"shard": shard, "shards": shards}).encode())
+    logger.info(f"Dispatched {shards} fleet shards to {function_name}")
+    return {"dispatched": shards}
+
+def collect_fleet(shard=0, shards=1):
+    """Collect every site owned by shard; a slow or failing site doesn't hold up the others' writes."""
+    sites = fleet.assign(cached("fleet_registry", CACHE_TTL_DEVICES, load_fleet_registry), shard, shards)
+    results = run_sites(sites, collect_site, FLEET_SITE_WORKERS)
+    logger.info(f"Fleet shard {shard}/{shards}: {results}")
+    logger.info(f"Governor stats: { {site.name: site.governor.stats for site in sites} }")
+    return {"shard": shard, "shards": shards, "sites": results}
+
 #################### 
 # LAMBDA HANDLER 
 #####################
-def handler(event, context):
-    """Lambda entry point."""
-    sk, ak = get_renogy_secrets()
-    host = os.getenv("RENOGY_HOST", "https://openapi.renogy.com")
+def collect_site(site=None):
+    """Poll, transform and write one site (the single .env-configured account when site is None)."""
+    host = site.config.get("host") if site else None
+    host = host or os.getenv("RENOGY_HOST", "https://openapi.renogy.com")
+    load_secrets = (lambda: get_renogy_secrets(site.config.get("secret_name"))) if site else get_renogy_secrets
+    sk, ak = cached(site_key("secrets", site), CACHE_TTL_SECRETS, load_secrets)
+
+    # Step 1: Get all devices (cached across warm invocations)
+    device_info = cached(site_key("device_info", site), CACHE_TTL_DEVICES, lambda: extract_device_info(
+        cached(site_key("device_list", site), CACHE_TTL_DEVICES, lambda: get_device_list(host, ak, sk, site))
+    ))
+
+    # Step 2: Query all devices concurrently for their latest data
+    raw_results = fetch_all_device_data(device_info, host, ak, sk, site=site)
+    sample_time = time.time()
+    samples = [
+        {"ts": sample_time, "device_id": device["deviceId"], "category": device["category"],
+         "name": device["name"], "sku": device["sku"], "data": raw_data,
+         **({"site": site.name} if site else {})}
+        for device, raw_data in zip(device_info, raw_results) if raw_data
+    ]
+    if raw_capture:
+        raw_capture.write(samples)
+    result = process_samples(samples, sample_time, site)
+    return {"devices": len(device_info), **result}
+
+def process_samples(samples, sample_time, site=None):
+    """
+    Raw device samples of one cycle (the capture format) -> records, derived
+    metrics, SoC, deadband -> Timestream, rollups and CloudWatch. Shared by
+    collect_site and bench/replay_capture.py.
+    """
     db = os.getenv("TIMESTREAM_DB", "nomad_oracle")
     table = os.getenv("TIMESTREAM_TABLE", "renogy_data")
-
-    # Step 1: Get all devices
-    devices = get_device_list(host, ak, sk)
-    device_info = extract_device_info(devices)
-
-    # Step 2: Query each device for its latest data
     combined_data = []
-    for device in device_info:
-        raw_data = get_device_data(device["deviceId"], host, ak, sk)
-        if raw_data:
-            transformed_data = process_device_data(
-                raw_data, device["category"], device["deviceId"], device["name"], device["sku"]
-            )
-            if transformed_data:
-                combined_data.append(transformed_data)
-
-    # Step 3: Calculate derived system load metrics
-    derived_load = calculate_system_load([item for sublist in combined_data for item in sublist])
+    store = MeasurementStore()
+    for sample in samples:
+        transformed_data = process_device_data(
+            sample["data"], sample["category"], sample["device_id"], sample.get("name", ""), sample.get("sku", ""), store
+        )
+        if transformed_data:
+            combined_data.append(transformed_data)
+
+    # Step 3: Calculate derived metrics (system load, inverter draw)
+    if site:
+        derived_devices = site.state("derived_devices", lambda: site_derived_devices(site))
+        engine = site.state("derived", lambda: build_derived_engine(derived_devices))
+        derived_load = calculate_system_load(store, engine, derived_devices)
+    else:
+        derived_load = calculate_system_load(store)
     if derived_load:
         combined_data.append(derived_load)
+        store.extend(derived_load)
+
+    # Step 3b: Advance the coulomb-counting state of charge from the main shunt
+    battery = calculate_state_of_charge(store, sample_time, site=site)
+    if battery:
+        combined_data.append(battery)
+        store.extend(battery)
 
-    # Step 4: Write all data to Timestream
+    # Step 4: Write what moved past its deadband to Timestream (tagged with a site dimension in fleet mode)
+    written = 0
     if combined_data:
-        write_to_timestream(combined_data, db, table)
+        if site:
+            for entry in combined_data:
+                for item in entry:
+                    item["site"] = site.name
+        deadband_filter = site.state("deadband", filter_from_env) if site and deadband else deadband
+        minute_time = sample_time - sample_time % 60  # same minute write_to_timestream stamps records with
+        combined_data = apply_deadband(combined_data, minute_time, deadband_filter)
+        if combined_data:
+            written = write_to_timestream(combined_data, db, table)
+
+    # Step 4b: Fold samples into rollup windows and write any that closed
+    rollups_engine = rollup_engine
+    if site and rollup_engine:
+        rollups_engine = site.state("rollups", lambda: RollupEngine(ROLLUP_WINDOWS, max_gap=rollup_engine.max_gap))
+    if rollups_engine:
+        rollups = []
+        for item in store:
+            rollups.extend(rollups_engine.add((item["uname"], item["sub"]), item["measure"], item["value"], sample_time))
+        if rollups:
+            write_rollups_to_timestream(rollups, db, table, site)
     
-    # Step 5: Collect Metrics and Publish to CloudWatch
-    cw_metrics = []
-    try:
-        shnt_071_volt = next(
-            item for sublist in combined_data for item in sublist
-            if item["uname"] == "shnt-071" and item["measure"] == "volt" and item["sub"] == "pri"
-        )["value"]
-        shnt_071_amps = next(
-            item for sublist in combined_data for item in sublist
-            if item["uname"] == "shnt-071" and item["measure"] == "amps" and item["sub"] == "pri"
-        )["value"]
-        mppt_914_amps = next(
-            item for sublist in combined_data for item in sublist
-            if item["uname"] == "mppt-914" and item["measure"] == "amps" and item["sub"] == "pri"
-        )["value"]
-        mppt_914_volts = next(
-            item for sublist in combined_data for item in sublist
-            if item["uname"] == "mppt-914" and item["measure"] == "volt" and item["sub"] == "pri"
-        )["value"]
-
-        # Add metrics to the list
-        cw_metrics.append({
-            "MetricName": "MainVoltage",
-            "Value": shnt_071_volt,
-            "Unit": "None",
-            "Dimensions": [{"Name": "Device", "Value": "Main"}]
-        })
-        cw_metrics.append({
-            "MetricName": "MainCurrent",
-            "Value": shnt_071_amps,
-            "Unit": "None",
-            "Dimensions": [{"Name": "Device", "Value": "Main"}]
-        })
-        cw_metrics.append({
-            "MetricName": "MPPTVoltage",
-            "Value": mppt_914_volts,
-            "Unit": "None",
-            "Dimensions": [{"Name": "Device", "Value": "MPPT"}]
-        })
-        cw_metrics.append({
-            "MetricName": "MPPTCurrent",
-            "Value": mppt_914_amps,
-            "Unit": "None",
-            "Dimensions": [{"Name": "Device", "Value": "MPPT"}]
-        })
+    # Step 5: Publish metrics to CloudWatch (EMF log lines by default)
+    published = publish_metrics_to_cloudwatch(store, site=site)
+    print(f"Published {published} metrics to CloudWatch.")
 
-        # Publish all metrics in a single call
-        publish_metrics_to_cloudwatch(cw_metrics)
-        print(f"Published {len(cw_metrics)} metrics to CloudWatch.")
-        logging.info (f"Published {len(cw_metrics)} metrics to CloudWatch.")
-        
-    except StopIteration:
-        logging.error("Required data for metrics not found.")
\ No newline at end of file
+    # Step 6: Save SoC state every invocation; a recycled container would otherwise reload stale Ah/Wh totals
+    if battery:
+        get_soc_estimator(site).persist()
+    return {"records": written, "metrics": published}
+
+def handler(event, context):
+    """Lambda entry point."""
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    try:
+        if FLEET_REGISTRY:
+            event = event or {}
+            shards = int(event.get("shards", FLEET_SHARDS))
+            if shards > 1 and "shard" not in event:
+                return dispatch_shards(shards, context)
+            result = collect_fleet(int(event.get("shard", 0)), shards)
+            logger.info(f"Cache stats: {cache_stats}")
+            return result
+
+        collect_site()
+        logger.info(f"Cache stats: {cache_stats}")
+        logger.info(f"Governor stats: {governor.stats}")
+        if deadband:
+            logger.info(f"Deadband stats: {deadband.stats}")
+    finally:
+        # Close this invocation's capture file so it is uploaded now rather than lost on recycle
+        if raw_capture and RAW_CAPTURE_BUCKET:
+            raw_capture.close()
+        # Clients are built lazily during the first collection, so their timings exist only now
+        if PROFILE_STARTUP and cold_start:
+            logger.info(f"Cold start: {startup_timings}")
+
+startup_timings["init_ms"] = round((time.perf_counter() - _init_started) * 1000, 1)
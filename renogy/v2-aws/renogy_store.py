@@ -0,0 +1,41 @@
+####################
+# MEASUREMENT STORE
+# Flattened measurement records indexed by (uname, sub, measure)
+#####################
+
+
+class MeasurementStore:
+    """Keyed container for transformed measurements with O(1) lookups."""
+
+    def __init__(self, records=None):
+        self._records = []
+        self._index = {}
+        if records:
+            self.extend(records)
+
+    def add(self, item):
+        """Add one measurement dict; the first sample for a key wins the lookup (like next())."""
+        self._records.append(item)
+        self._index.setdefault((item["uname"], item["sub"], item["measure"]), item)
+
+    def extend(self, items):
+        """Add many measurement dicts."""
+        for item in items:
+            self.add(item)
+
+    def get(self, uname, sub, measure, default=None):
+        """Return the measurement dict for a key, or default if missing."""
+        return self._index.get((uname, sub, measure), default)
+
+    def value(self, uname, sub, measure):
+        """Return the value for a key; raises KeyError if missing."""
+        return self._index[(uname, sub, measure)]["value"]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
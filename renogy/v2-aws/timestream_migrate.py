@@ -0,0 +1,99 @@
+"""
+Migrate/backfill single-measure Renogy records into multi-measure records.
+
+Reads the existing table in time windows (bounded memory), pivots each
+(device, sub, time) into one MULTI record and writes it through the same
+batched writer the Lambda uses.
+
+    python3 timestream_migrate.py --db nomad_oracle --source renogy_data \
+        --target renogy_data_multi --start 2024-12-01 --end 2025-01-01
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from renogy_ingest import TIMESTREAM_MULTI_MEASURE_NAME, get_aws_client, logger, write_to_timestream
+
+QUERY_COLUMNS = ("time", "device_id", "uname", "sub", "category", "name", "sku", "measure_name", "measure_value::double")
+
+
+def ensure_target_table(db, source, target):
+    """Create the target table (copying source retention) with magnetic store writes enabled for backfills."""
+    timestream_client = get_aws_client("timestream-write")
+    try:
+        timestream_client.describe_table(DatabaseName=db, TableName=target)
+        return
+    except timestream_client.exceptions.ResourceNotFoundException:
+        pass
+    retention = timestream_client.describe_table(DatabaseName=db, TableName=source)["Table"]["RetentionProperties"]
+    timestream_client.create_table(
+        DatabaseName=db,
+        TableName=target,
+        RetentionProperties=retention,
+        MagneticStoreWriteProperties={"EnableMagneticStoreWrites": True},
+    )
+    logger.info(f"Created Timestream table {db}.{target}")
+
+
+def _parse_time_ms(value):
+    """Convert a Timestream timestamp ('2024-12-15 12:00:00.000000000') to ms since epoch."""
+    base = datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    millis = int(value[20:23] or 0) if len(value) > 20 else 0
+    return int(base.timestamp() * 1000) + millis
+
+
+def query_window(query_client, db, source, start, end):
+    """Return single-measure items for [start, end) as measurement dicts carrying their own time."""
+    query = (
+        f"SELECT {', '.join(QUERY_COLUMNS)} FROM \"{db}\".\"{source}\" "
+        f"WHERE time >= from_iso8601_timestamp('{start.isoformat()}') "
+        f"AND time < from_iso8601_timestamp('{end.isoformat()}') "
+        f"AND measure_name <> '{TIMESTREAM_MULTI_MEASURE_NAME}'"
+    )
+    items = []
+    for page in query_client.get_paginator("query").paginate(QueryString=query):
+        for row in page["Rows"]:
+            time_value, device_id, uname, sub, category, name, sku, measure, value = (
+                d.get("ScalarValue") for d in row["Data"]
+            )
+            if value is None:
+                continue
+            items.append({
+                "time": _parse_time_ms(time_value), "device_id": device_id, "uname": uname, "sub": sub,
+                "category": category, "name": name, "sku": sku, "measure": measure, "value": float(value),
+            })
+    return items
+
+
+def migrate_to_multi_measure(db, source, target, start, end, window=timedelta(hours=6)):
+    """Backfill [start, end) from source into target as MULTI records; returns records written."""
+    query_client = get_aws_client("timestream-query")
+    ensure_target_table(db, source, target)
+    written = 0
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        items = query_window(query_client, db, source, window_start, window_end)
+        if items:
+            written += write_to_timestream([items], db, target, mode="MULTI")
+        logger.info(f"Migrated {window_start.isoformat()} - {window_end.isoformat()}: {len(items)} measures")
+        window_start = window_end
+    return written
+
+
+def _parse_date(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill single-measure Renogy data into multi-measure records")
+    parser.add_argument("--db", default="nomad_oracle")
+    parser.add_argument("--source", default="renogy_data")
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--start", type=_parse_date, required=True, help="UTC start, e.g. 2024-12-01")
+    parser.add_argument("--end", type=_parse_date, default=datetime.now(timezone.utc), help="UTC end (default now)")
+    parser.add_argument("--window-hours", type=float, default=6, help="query window size")
+    args = parser.parse_args()
+
+    total = migrate_to_multi_measure(args.db, args.source, args.target, args.start, args.end,
+                                     timedelta(hours=args.window_hours))
+    print(f"Wrote {total} multi-measure records to {args.db}.{args.target}")